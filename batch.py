@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import argparse
+import os.path as pth
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from time import perf_counter
+from cache import RecipeCache
+from export import save_list
+from recipe import Recipe
+
+
+def read_manifest(manifest):
+    """Read the names of the recipes listed in a manifest.
+
+    Blank lines and lines starting with '#' are ignored.
+    :param manifest: the path of the manifest file
+    :return: a list of recipe names (located in saved_recipes)
+    """
+    with open(manifest, "r") as manifest_file:
+        names = [line.strip() for line in manifest_file]
+    return [name for name in names if name and not name.startswith('#')]
+
+
+def merge_tree(recipes):
+    """Merge recipes pairwise until a single recipe is left.
+
+    Every round adds each odd recipe into its even neighbour, so no recipe is merged more than log2(n) times.
+    :param recipes: a list of recipes (will be modified)
+    :return: a recipe holding every ingredient of every recipe
+    """
+    if not recipes:
+        return Recipe()
+    while len(recipes) > 1:
+        merged = [recipes[i+1].add_to(recipes[i]) for i in range(0, len(recipes)-1, 2)]
+        if len(recipes) % 2:
+            # Odd recipe out is carried up to the next round.
+            merged.append(recipes[-1])
+        recipes = merged
+    return recipes[0]
+
+
+# Recipes read by this worker process, so recipes included by several others are only expanded once.
+_cache = None
+
+
+def load_chunk(names):
+    """Load a chunk of recipes and merge them together (run inside a worker process).
+
+    A recipe that can't be read (or whose units don't match the rest) is left out, so the others are still merged.
+    :param names: the recipes (located in saved_recipes) to be loaded
+    :return: a tuple of a recipe holding every ingredient of the chunk and a list of (name, error message) pairs
+     for the recipes left out
+    """
+    global _cache
+    if _cache is None:
+        _cache = RecipeCache()
+    merged, failed = Recipe(), []
+    for name in names:
+        try:
+            _cache.load('saved_recipes/' + name).add_to(merged)
+        except (TypeError, ValueError, AttributeError, OSError) as error:
+            failed.append((name, str(error) or type(error).__name__))
+    return merged, failed
+
+
+def aggregate(names, executor, workers):
+    """Load every recipe in names in parallel and merge them into one shopping list.
+
+    :param names: the recipes (located in saved_recipes) to be loaded
+    :param executor: the process pool used to parse the recipes
+    :param workers: the number of processes in the pool
+    :return: a tuple of the merged shopping list and a list of (name, error message) pairs for the recipes left out
+    """
+    # A few chunks per worker keeps the pool busy without pickling a recipe per file.
+    chunk_size = max(1, len(names) // (workers*4))
+    chunks = [names[i:i+chunk_size] for i in range(0, len(names), chunk_size)]
+    recipes, failed = [], []
+    for merged, chunk_failed in executor.map(load_chunk, chunks):
+        recipes.append(merged)
+        failed.extend(chunk_failed)
+    return merge_tree(recipes), failed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Build shopping lists from recipe manifests without the UI.")
+    parser.add_argument('manifests', nargs='+',
+                        help="files listing one recipe (from saved_recipes) per line")
+    parser.add_argument('-o', '--output',
+                        help="name to save the list as (only with a single manifest, default: manifest name)")
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count(),
+                        help="number of worker processes (default: number of cores)")
+    args = parser.parse_args(args)
+
+    if args.output and len(args.manifests) > 1:
+        parser.error("--output can only be used with a single manifest")
+
+    total_files, total_failed = 0, 0
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for manifest in args.manifests:
+            try:
+                names = read_manifest(manifest)
+            except OSError as error:
+                print("{}: could not read manifest: {}".format(manifest, error), file=sys.stderr)
+                total_failed += 1
+                continue
+            manifest_start = perf_counter()
+            shopping_list, failed = aggregate(names, executor, args.jobs)
+            save_list(shopping_list, args.output or pth.basename(manifest))
+            elapsed = perf_counter() - manifest_start
+
+            # The list is saved without the recipes that failed, so say which they were.
+            for name, message in failed:
+                print("{}: skipped {}: {}".format(manifest, name, message), file=sys.stderr)
+            total_failed += len(failed)
+
+            total_files += len(names)
+            print("{}: {} recipes in {:.3f}s ({:.1f} files/sec)".format(
+                manifest, len(names), elapsed, len(names)/elapsed if elapsed else 0.0))
+
+    elapsed = perf_counter() - start
+    print("Total: {} recipes in {:.3f}s with {} workers ({:.1f} files/sec)".format(
+        total_files, elapsed, args.jobs, total_files/elapsed if elapsed else 0.0))
+    if total_failed:
+        parser.exit(1, "{} recipes or manifests could not be read; see above.\n".format(total_failed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import argparse
+import curses
+import os.path as pth
+import platform
+import sys
+import tempfile
+from contextlib import contextmanager
+from json import dump, load
+from statistics import median
+from time import perf_counter, strftime
+import util
+from export import AisleMap, export
+from importer import validate_record
+from listview import ListView
+from matcher import RecipeMatcher
+from mainscreen import MainScreen
+from recipe import Recipe
+
+QUALIFIERS = ['cups', 'grams', 'whole', 'chopped', '']
+
+
+class FakeWindow:
+    """Stands in for a curses window, counting the calls made to it instead of drawing."""
+    def __init__(self, height, width):
+        self.height, self.width = height, width
+        self.calls = 0
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def _draw(self, *args):
+        self.calls += 1
+
+    addstr = hline = vline = bkgd = erase = clear = touchwin = noutrefresh = refresh = timeout = _draw
+
+
+@contextmanager
+def fake_curses():
+    """Let drawing code run without a terminal by replacing the curses calls that need one."""
+    saved = curses.color_pair, curses.doupdate
+    curses.color_pair = lambda pair: pair << 8
+    curses.doupdate = lambda: None
+    try:
+        yield
+    finally:
+        curses.color_pair, curses.doupdate = saved
+
+
+def synthetic_recipe(size, offset=0):
+    """Create a recipe with size ingredients, spread over a few qualifiers."""
+    recipe = Recipe()
+    for i in range(size):
+        recipe.add_ingredient("ingredient {}".format(i+offset), i*0.5+1, QUALIFIERS[i % len(QUALIFIERS)])
+    return recipe
+
+
+def time_call(function, repeats, setup=None):
+    """Time a function several times.
+
+    :param function: the function to time, called with the result of setup (if given)
+    :param repeats: the number of times to call it
+    :param setup: a function run untimed before each call
+    :return: a dict of the min and median time in seconds, and the number of repeats
+    """
+    times = []
+    for _ in range(repeats):
+        argument = setup() if setup is not None else None
+        start = perf_counter()
+        function(argument) if setup is not None else function()
+        times.append(perf_counter() - start)
+    return {'min': min(times), 'median': median(times), 'repeats': repeats}
+
+
+def make_screen(recipe, height=50, width=162):
+    """Create a main screen around a recipe, drawing into a fake window."""
+    window = FakeWindow(height, width)
+    screen = MainScreen.__new__(MainScreen)
+    screen._list_height, screen._list_width = height, width
+    screen._list_display = window
+    screen._shopping_list = recipe
+    screen._view = ListView(window, recipe, 2, 1, height-4, (width-2)//20)
+    screen._overlay = None
+    return screen
+
+
+def run_benchmarks(sizes, directory):
+    """Run every benchmark at every size.
+
+    :param sizes: the numbers of ingredients to benchmark with
+    :param directory: a directory for files written by the benchmarks
+    :return: a dict of benchmark name to timings
+    """
+    results = {}
+    for size in sizes:
+        repeats = max(3, min(100, 1000000 // size))
+        recipe = synthetic_recipe(size)
+        other = synthetic_recipe(size, offset=size//2)
+        json_name = pth.join(directory, 'recipe.json')
+        line_name = pth.join(directory, 'recipe.ndjson')
+        list_name = pth.join(directory, 'recipe.txt')
+        csv_name = pth.join(directory, 'recipe.csv')
+        # Ingredients spread over eight aisles, with a fifth of them in none.
+        aisles = AisleMap({"aisle {}".format(i): ["ingredient {}".format(n) for n in range(i, size, 10)]
+                           for i in range(8)})
+        recipe.save_to_file(json_name).save_to_file(line_name)
+
+        # A recipe of ten ingredients (from a vocabulary of 2000) per ten in the list, matched with half on hand.
+        matcher = RecipeMatcher()
+        for i in range(max(1, size//10)):
+            matcher.add_recipe("recipe {}".format(i), ["ingredient {}".format((i*7 + j*131) % 2000) for j in range(10)])
+        on_hand = ["ingredient {}".format(i) for i in range(0, 2000, 2)]
+
+        # Dump records of ten ingredients per ten in the list, with quantities written the ways dumps write them.
+        quantities = ['1', '1/2', '1 1/2', '0.25', '\u00be', 2]
+        records = [{'name': "recipe {}".format(i),
+                    'ingredients': {"ingredient {}".format((i*7 + j*131) % 2000): [quantities[(i+j) % 6], 'cups']
+                                    for j in range(10)}} for i in range(max(1, size//10))]
+
+        cases = {
+            'add_ingredient': (lambda: synthetic_recipe(size), None),
+            'add_to': (lambda target: other.add_to(target), recipe.copy),
+            'add_weighted': (lambda target: target.add_weighted([(recipe, 2), (other, 0.5)]), Recipe),
+            'scale': (lambda target: target.scale(1.5), recipe.copy),
+            'copy': (recipe.copy, None),
+            'read_from_file/json': (lambda: Recipe.create_from_file(json_name), None),
+            'read_from_file/ndjson': (lambda: Recipe.create_from_file(line_name), None),
+            'save_to_file/json': (lambda: recipe.save_to_file(json_name), None),
+            'save_to_file/ndjson': (lambda: recipe.save_to_file(line_name), None),
+            'save_as_list': (lambda: recipe.save_as_list(list_name), None),
+            'match': (lambda: matcher.match(on_hand, 2), None),
+            'validate_records': (lambda: [validate_record(record) for record in records], None),
+            'export/grouped': (lambda: export(recipe, [(list_name, 'text'), (csv_name, 'csv'),
+                                                       (line_name, 'ndjson')], aisles), None),
+        }
+        with fake_curses():
+            screen = make_screen(recipe.copy())
+            # Full redraw, as after clearing the screen, and a redraw after a single change.
+            cases['show_list/full'] = (lambda _: screen.show_list(), screen._view.invalidate)
+            cases['show_list/changed'] = (
+                lambda _: screen.show_list(),
+                lambda: screen._shopping_list.add_ingredient("ingredient 0", 1, QUALIFIERS[0]))
+            cases['color_box'] = (lambda: util.color_box(screen._list_display, 0, 0, 49, 161, 3), None)
+
+            for name, (function, setup) in cases.items():
+                name = "{}/{}".format(name, size)
+                results[name] = time_call(function, repeats, setup)
+                print("{:>32}: {:10.6f}s".format(name, results[name]['median']))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Find benchmarks that got slower than a previous run.
+
+    :param results: the timings of this run
+    :param baseline: the timings of a previous run
+    :param threshold: how much slower (as a fraction) counts as a regression
+    :return: a list of (name, old median, new median) for each regression
+    """
+    regressions = []
+    for name, timing in sorted(results.items()):
+        old = baseline.get(name)
+        if old is not None and timing['median'] > old['median']*(1+threshold):
+            regressions.append((name, old['median'], timing['median']))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark recipe operations and screen rendering.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000, 1000000],
+                        help="numbers of ingredients to benchmark with")
+    parser.add_argument('-o', '--output', default='benchmark_{}.json'.format(strftime('%Y%m%d_%H%M%S')),
+                        help="file to save results to")
+    parser.add_argument('--compare', help="results of a previous run to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="slowdown (as a fraction) reported as a regression (default: 0.2)")
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(args.sizes, directory)
+
+    with open(args.output, "w") as write_file:
+        dump({'python': platform.python_version(), 'platform': platform.platform(),
+              'time': strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, write_file, indent=1)
+    print("Results saved to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare, "r") as read_file:
+            baseline = load(read_file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print("Regression in {}: {:.6f}s -> {:.6f}s ({:+.0%})".format(name, old, new, new/old-1))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
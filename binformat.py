@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import argparse
+import mmap
+import os.path as pth
+import struct
+import sys
+from array import array
+import util
+from names import normalize
+from recipe import BINARY_MAGIC, Recipe
+
+# Binary recipes converted alongside the original file get this extension.
+BINARY_EXTENSION = '.rcpb'
+
+# Magic, format version, unused, number of ingredients, number of strings.
+HEADER = struct.Struct('<4sHHII')
+VERSION = 1
+
+# File layout, each section starting on an 8 byte boundary:
+#   header
+#   string offsets: (strings + 1) uint32, string i is the utf-8 bytes between offsets i and i+1
+#   string data: names and qualifiers, each stored once
+#   name column: ingredients uint32 string ids, sorted by the utf-8 bytes of the name
+#   qualifier column: ingredients uint32 string ids, in the same order
+#   quantity column: ingredients float64, in the same order
+# Every number is little-endian.
+
+
+def _aligned(offset):
+    """Round an offset up to the next multiple of 8."""
+    return (offset + 7) & ~7
+
+
+def _layout(ingredients, strings, string_bytes):
+    """Work out where each section of a file starts.
+
+    :return: a tuple of the offsets of the string offsets, string data, name, qualifier and quantity sections
+    """
+    offsets_start = _aligned(HEADER.size)
+    data_start = _aligned(offsets_start + 4*(strings+1))
+    names_start = _aligned(data_start + string_bytes)
+    qualifiers_start = names_start + 4*ingredients
+    quantities_start = _aligned(qualifiers_start + 4*ingredients)
+    return offsets_start, data_start, names_start, qualifiers_start, quantities_start
+
+
+def _little_endian(column):
+    """Get the bytes of an array as stored in a file."""
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def save_binary(recipe, filename):
+    """Save any recipe in the binary format.
+
+    The file is only replaced once it has been fully written.
+    :param recipe: the recipe (or anything with items()) to save
+    :param filename: the name of the file to be written to
+    :return: a reference to the recipe
+    """
+    # Intern every name and qualifier, then order rows by the bytes of the name so lookups can bisect.
+    string_ids, encoded = {}, []
+    rows = []
+    for name, (quantity, qualifier) in recipe.items():
+        for string in (name, qualifier):
+            if string not in string_ids:
+                string_ids[string] = len(encoded)
+                encoded.append(string.encode('utf-8'))
+        rows.append((encoded[string_ids[name]], string_ids[name], string_ids[qualifier], quantity))
+    rows.sort()
+
+    offsets = array('I', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    layout = _layout(len(rows), len(encoded), offsets[-1])
+
+    sections = [
+        (layout[0], _little_endian(offsets)),
+        (layout[1], b''.join(encoded)),
+        (layout[2], _little_endian(array('I', [row[1] for row in rows]))),
+        (layout[3], _little_endian(array('I', [row[2] for row in rows]))),
+        (layout[4], _little_endian(array('d', [row[3] for row in rows]))),
+    ]
+    with util.atomic_write(pth.join(pth.dirname(__file__), filename), "wb") as write_file:
+        write_file.write(HEADER.pack(BINARY_MAGIC, VERSION, 0, len(rows), len(encoded)))
+        for start, data in sections:
+            # Pad up to where the section starts.
+            write_file.write(b'\0' * (start - write_file.tell()))
+            write_file.write(data)
+    return recipe
+
+
+class MappedRecipe:
+    """Read-only recipe read straight from a memory-mapped binary file.
+
+    Nothing is decoded until it is asked for: lookups bisect the sorted name column and merges walk the columns.
+    """
+    __slots__ = ('_map', '_count', '_offsets', '_names', '_qualifiers', '_quantities', '_data_start', '_keys')
+
+    # Files are saved from recipes, whose names were already merged (see Recipe.merged).
+    merged = 0
+
+    def __init__(self, filename):
+        """Map a binary recipe file.
+
+        :param filename: the name of the file to map
+        :return: null
+        :raise ValueError: if the file isn't a binary recipe
+        """
+        # The map keeps its own handle on the file, so it stays readable even if the file is replaced.
+        with open(pth.join(pth.dirname(__file__), filename), "rb") as read_file:
+            try:
+                self._map = mmap.mmap(read_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped.
+                raise ValueError("{} is not a binary recipe.".format(filename))
+
+        magic, version, _, self._count, strings = HEADER.unpack_from(self._map) \
+            if len(self._map) >= HEADER.size else (b'', 0, 0, 0, 0)
+        if magic != BINARY_MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError("{} is not a binary recipe.".format(filename))
+
+        # The last string offset is the length of the string data, which places every later section.
+        offsets_start = _layout(self._count, strings, 0)[0]
+        self._offsets = self._column(offsets_start, 'I', strings+1)
+        _, self._data_start, names_start, qualifiers_start, quantities_start = \
+            _layout(self._count, strings, self._offsets[strings])
+        self._names = self._column(names_start, 'I', self._count)
+        self._qualifiers = self._column(qualifiers_start, 'I', self._count)
+        self._quantities = self._column(quantities_start, 'd', self._count)
+
+        # Row of each normalized name, built the first time a name isn't found as written (see _find()).
+        self._keys = None
+
+    def _column(self, start, typecode, length):
+        """Get a section of the file as a sequence of numbers, without copying it if possible."""
+        size = array(typecode).itemsize
+        view = memoryview(self._map)[start:start + size*length]
+        if sys.byteorder == 'little':
+            return view.cast(typecode)
+        column = array(typecode, view.tobytes())
+        column.byteswap()
+        return column
+
+    def close(self):
+        """Unmap the file (the recipe can't be used afterwards)."""
+        # The map can only be closed once nothing is viewing it.
+        for column in (self._offsets, self._names, self._qualifiers, self._quantities):
+            if isinstance(column, memoryview):
+                column.release()
+        self._map.close()
+
+    def _string(self, string_id):
+        """Decode a string from the string table."""
+        start = self._data_start + self._offsets[string_id]
+        return self._map[start:self._data_start + self._offsets[string_id+1]].decode('utf-8')
+
+    def _quantity(self, row):
+        """Get the quantity of a row, as an int if it is whole."""
+        quantity = self._quantities[row]
+        return int(quantity) if quantity.is_integer() else quantity
+
+    def _find(self, name):
+        """Find the row of an ingredient by bisecting the name column, or by its normalized name if it is written
+        differently (see names.normalize).
+
+        :return: the row, or -1 if there is no ingredient by that name
+        """
+        key = name.encode('utf-8')
+        data_start, offsets, names = self._data_start, self._offsets, self._names
+        low, high = 0, self._count
+        while low < high:
+            middle = (low+high) // 2
+            string_id = names[middle]
+            if self._map[data_start+offsets[string_id]:data_start+offsets[string_id+1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._string(names[low]) == name:
+            return low
+
+        if self._keys is None:
+            # The first spelling stored wins, as it does in a Recipe.
+            self._keys = {}
+            for row, string_id in enumerate(names):
+                self._keys.setdefault(normalize(self._string(string_id)), row)
+        return self._keys.get(normalize(name), -1)
+
+    def __iter__(self):
+        return (self._string(string_id) for string_id in self._names)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return self._find(name) >= 0
+
+    def items(self):
+        """Get every ingredient with its quantity, in order of name.
+
+        :return: an iterator of (name, (quantity, qualifier)) pairs
+        """
+        # Qualifiers repeat a lot, so each is only decoded once.
+        data, start, offsets = self._map, self._data_start, self._offsets
+        qualifiers = {}
+        for string_id, qualifier_id, quantity in zip(self._names, self._qualifiers, self._quantities):
+            qualifier = qualifiers.get(qualifier_id)
+            if qualifier is None:
+                qualifier = qualifiers[qualifier_id] = self._string(qualifier_id)
+            name = data[start+offsets[string_id]:start+offsets[string_id+1]].decode('utf-8')
+            yield name, (int(quantity) if quantity.is_integer() else quantity, qualifier)
+
+    def get_ingredient_quantity(self, name):
+        """Get the quantity of an ingredient.
+
+        :param name: the name of the ingredient
+        :return: a tuple of the quantity and qualifier of the ingredient
+        """
+        row = self._find(name)
+        if row < 0:
+            raise ValueError("No ingredient by that name.")
+        return self._quantity(row), self._string(self._qualifiers[row])
+
+    # Only relies on get_ingredient_quantity, so it works on the mapped file as is.
+    show_ingredient = Recipe.show_ingredient
+
+    def add_to(self, receiving_recipe):
+        """Add every ingredient in recipe to the shopping list.
+
+        :param receiving_recipe: the recipe to receive ingredients
+        :return: a reference to the receiving recipe
+        """
+        for ingredient, full_quantity in self.items():
+            receiving_recipe.add_ingredient(ingredient, full_quantity[0], full_quantity[1])
+        return receiving_recipe
+
+    def copy(self):
+        """Create a modifiable copy of the recipe.
+
+        :return: an identical copy of the recipe
+        """
+        return Recipe().restore(dict(self.items()))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Convert json or line-delimited recipes to the binary format.")
+    parser.add_argument('files', nargs='+', help="recipe or list files to convert")
+    parser.add_argument('-i', '--in-place', action='store_true',
+                        help="replace each file instead of writing FILE{} next to it".format(BINARY_EXTENSION))
+    args = parser.parse_args(args)
+
+    for filename in args.files:
+        filename = pth.abspath(filename)
+        recipe = Recipe.create_from_file(filename)
+        output = filename if args.in_place else filename + BINARY_EXTENSION
+        save_binary(recipe, output)
+        print("{}: {} ingredients -> {}".format(filename, len(recipe), output))
+
+if __name__ == "__main__":
+    main()
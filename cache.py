@@ -0,0 +1,222 @@
+__author__ = 'Kellan Childers'
+
+import os
+import os.path as pth
+from collections import OrderedDict
+from binformat import MappedRecipe
+from recipe import RECIPE_QUALIFIER, Recipe, is_binary
+
+
+class RecipeView:
+    """Read-only view of a parsed recipe, safe to hand out many times from a cache."""
+    __slots__ = ('_recipe',)
+
+    def __init__(self, recipe):
+        """Wrap a recipe that nothing else will modify.
+
+        :param recipe: the recipe to view
+        :return: null
+        """
+        self._recipe = recipe
+
+    def __iter__(self):
+        return iter(self._recipe)
+
+    def __len__(self):
+        return len(self._recipe)
+
+    @property
+    def merged(self):
+        """How many ingredients of the file were merged into others (see Recipe.merged)."""
+        return self._recipe.merged
+
+    def items(self):
+        """Get every ingredient with its quantity.
+
+        :return: an iterable of (name, (quantity, qualifier)) pairs
+        """
+        return self._recipe.items()
+
+    def get_ingredient_quantity(self, name):
+        """Get the quantity of an ingredient.
+
+        :param name: the name of the ingredient
+        :return: a tuple of the quantity and qualifier of the ingredient
+        """
+        return self._recipe.get_ingredient_quantity(name)
+
+    def show_ingredient(self, name):
+        """Get an ingredient and show it as a string."""
+        return self._recipe.show_ingredient(name)
+
+    def add_to(self, receiving_recipe):
+        """Add every ingredient in recipe to the shopping list.
+
+        :param receiving_recipe: the recipe to receive ingredients
+        :return: a reference to the receiving recipe
+        """
+        return self._recipe.add_to(receiving_recipe)
+
+    def copy(self):
+        """Create a modifiable copy of the recipe.
+
+        :return: an identical copy of the recipe
+        """
+        return self._recipe.copy()
+
+
+class RecipeCache:
+    """Least-recently-used cache of parsed recipe files, checked against each file's mtime and size.
+
+    Recipes that include other recipes (see RECIPE_QUALIFIER) are cached expanded, and are read again only when
+    they or a recipe they include change.
+    """
+    def __init__(self, max_ingredients=100000):
+        """Create an empty cache.
+
+        :param max_ingredients: the total number of ingredients the cached recipes may hold
+        :return: null
+        """
+        self.max_ingredients = max_ingredients
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        # Resolved path -> (mtime_ns, size, view, included), oldest first, where included maps the resolved path of
+        # every recipe included (directly or not) to its (mtime_ns, size) when the view was expanded.
+        self._entries = OrderedDict()
+        # Resolved paths of the recipes being expanded, outermost first, to catch recipes including themselves.
+        self._expanding = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, filename):
+        """Get a recipe from the cache, reading the file if it (or a recipe it includes) changed or isn't cached.
+
+        Binary files are mapped instead of parsed, since a MappedRecipe is already read-only. Recipes included by
+        several others are only expanded once, then taken from the cache.
+        :param filename: the name of the file to load
+        :return: a read-only view of the recipe, with included recipes expanded
+        :raise ValueError: if the recipe includes itself, directly or through other recipes
+        """
+        path = pth.realpath(pth.join(pth.dirname(__file__), filename))
+        stat = os.stat(path)
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size and \
+                self._unchanged(entry[3]):
+            self.hits += 1
+            self._entries.move_to_end(path)
+            return entry[2]
+
+        if path in self._expanding:
+            cycle = self._expanding[self._expanding.index(path):] + [path]
+            raise ValueError("Recipe includes itself: " + ' -> '.join(pth.basename(step) for step in cycle))
+
+        self.misses += 1
+        view = MappedRecipe(path) if is_binary(path) else RecipeView(Recipe.create_from_file(path))
+        included = {}
+        if any(qualifier == RECIPE_QUALIFIER for _, (_, qualifier) in view.items()):
+            read, (view, included) = view, self._expand(path, view)
+            if isinstance(read, MappedRecipe):
+                read.close()
+        self.invalidate(path)
+        self._entries[path] = (stat.st_mtime_ns, stat.st_size, view, included)
+        self._size += len(view)
+        self._evict()
+        return view
+
+    def _expand(self, path, view):
+        """Replace the recipes a recipe includes with their ingredients.
+
+        :param path: the resolved path of the recipe
+        :param view: the recipe as read
+        :return: a tuple of a view of the expanded recipe and the included dict of its cache entry
+        """
+        expanded, included = Recipe(), {}
+        self._expanding.append(path)
+        try:
+            for name, (quantity, qualifier) in view.items():
+                if qualifier != RECIPE_QUALIFIER:
+                    expanded.add_ingredient(name, quantity, qualifier)
+                    continue
+
+                # Included recipes are named relative to the recipe including them, and expanded through the cache.
+                if pth.basename(name) != name or name in ('.', '..'):
+                    raise ValueError("Included recipe {} must be in the same directory".format(name))
+                component_path = pth.realpath(pth.join(pth.dirname(path), name))
+                component = self.load(component_path)
+                component_entry = self._entries[component_path]
+                included[component_path] = component_entry[:2]
+                included.update(component_entry[3])
+                if quantity == 1:
+                    component.add_to(expanded)
+                else:
+                    expanded.add_weighted([(component, quantity)])
+        finally:
+            self._expanding.pop()
+        return RecipeView(expanded), included
+
+    @staticmethod
+    def _unchanged(included):
+        """Check that none of the recipes included by a cached recipe changed since it was expanded."""
+        for path, signature in included.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return False
+            if (stat.st_mtime_ns, stat.st_size) != signature:
+                return False
+        return True
+
+    def included(self, filename):
+        """Get the recipes a cached recipe includes, directly or through other recipes.
+
+        :param filename: the name of the recipe's file
+        :return: a list of the resolved paths of the included recipes (empty if the recipe isn't cached)
+        """
+        entry = self._entries.get(pth.realpath(pth.join(pth.dirname(__file__), filename)))
+        return list(entry[3]) if entry is not None else []
+
+    def _drop(self, view):
+        """Let go of a view leaving the cache, unmapping it if it is a mapped file (so its map and file handle
+        aren't held until it is garbage collected)."""
+        self._size -= len(view)
+        if isinstance(view, MappedRecipe):
+            view.close()
+
+    def invalidate(self, filename):
+        """Drop a file from the cache (a mapped recipe can't be used once it is dropped).
+
+        :param filename: the name of the file to drop
+        :return: a reference to the cache
+        """
+        entry = self._entries.pop(pth.realpath(pth.join(pth.dirname(__file__), filename)), None)
+        if entry is not None:
+            self._drop(entry[2])
+        return self
+
+    def clear(self):
+        """Drop every recipe from the cache.
+
+        :return: a reference to the cache
+        """
+        while self._entries:
+            self._drop(self._entries.popitem()[1][2])
+        return self
+
+    def _evict(self):
+        """Drop least recently used recipes until the cache fits its budget (always keeping the newest)."""
+        while self._size > self.max_ingredients and len(self._entries) > 1:
+            _, (_, _, view, _) = self._entries.popitem(last=False)
+            self._drop(view)
+            self.evictions += 1
+
+    def stats(self):
+        """Get the cache's counters.
+
+        :return: a dict of hits, misses, evictions, entries and ingredients held
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'ingredients': self._size}
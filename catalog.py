@@ -0,0 +1,208 @@
+__author__ = 'Kellan Childers'
+
+import os
+import os.path as pth
+import sqlite3
+from cache import RecipeCache
+from names import normalize
+from recipe import RECIPE_QUALIFIER, iter_records
+
+
+# Version of the tables below; a catalog written by another version is rebuilt, as it is only an index.
+SCHEMA_VERSION = 3
+
+
+class Catalog:
+    """Index of the recipes in saved_recipes, kept in a SQLite database next to them."""
+    def __init__(self, directory='saved_recipes', database='.catalog.db'):
+        """Open (or create) the catalog of a recipe directory.
+
+        :param directory: the directory of recipes to index (relative to the app)
+        :param database: the name of the database file inside directory
+        :return: null
+        """
+        self._directory = directory
+        self._full_directory = pth.join(pth.dirname(__file__), directory)
+        # The app opens and refreshes the catalog on its worker thread, then only uses it from the main thread.
+        self._connection = sqlite3.connect(pth.join(self._full_directory, database), check_same_thread=False)
+        version, = self._connection.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            self._connection.executescript("""
+                DROP TABLE IF EXISTS includes;
+                DROP TABLE IF EXISTS ingredients;
+                DROP TABLE IF EXISTS recipes;
+                PRAGMA user_version = {};
+            """.format(SCHEMA_VERSION))
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS recipes (
+                name TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                valid INTEGER NOT NULL,
+                ingredient_count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ingredients (
+                recipe TEXT NOT NULL REFERENCES recipes(name) ON DELETE CASCADE,
+                name TEXT NOT NULL COLLATE NOCASE,
+                key TEXT NOT NULL,
+                quantity NUMERIC NOT NULL,
+                qualifier TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS includes (
+                recipe TEXT NOT NULL REFERENCES recipes(name) ON DELETE CASCADE,
+                included TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ingredients_by_name ON ingredients(name);
+            CREATE INDEX IF NOT EXISTS ingredients_by_key ON ingredients(key);
+            CREATE INDEX IF NOT EXISTS ingredients_by_recipe ON ingredients(recipe);
+            CREATE INDEX IF NOT EXISTS includes_by_included ON includes(included);
+        """)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+
+        # Recipes are read through a cache, so recipes they include are expanded (each only once per refresh).
+        self._cache = RecipeCache()
+
+    def close(self):
+        """Close the database."""
+        self._connection.close()
+
+    def _parse(self, name):
+        """Read a recipe file, expanding the recipes it includes, and check that every ingredient is well-formed.
+
+        :param name: the name of the recipe (located in the catalog's directory)
+        :return: a tuple of a list of (name, quantity, qualifier) tuples (None if the file isn't a valid recipe) and
+         the names of the recipes it includes
+        """
+        filename = pth.join(self._directory, name)
+        try:
+            recipe = self._cache.load(filename)
+            rows = []
+            for ingredient, (quantity, qualifier) in recipe.items():
+                # Whole quantities are kept as ints, as a Recipe holds them.
+                quantity = float(quantity)
+                rows.append((ingredient, int(quantity) if quantity.is_integer() else quantity, str(qualifier)))
+            return rows, [pth.basename(path) for path in self._cache.included(filename)]
+        except (TypeError, ValueError, AttributeError, OSError):
+            # Includes missing recipes or itself, or isn't a recipe at all.
+            return None, self._declared_includes(filename)
+
+    @staticmethod
+    def _declared_includes(filename):
+        """Read the names of the recipes a recipe file includes, without expanding them.
+
+        Kept for recipes that can't be expanded yet, so they are indexed again once the recipes they include change.
+        :param filename: the name of the recipe file
+        :return: a list of the names of the recipes it includes (empty if the file can't be read)
+        """
+        try:
+            return [name for name, _, qualifier in iter_records(filename)
+                    if qualifier == RECIPE_QUALIFIER and isinstance(name, str) and pth.basename(name) == name]
+        except (TypeError, ValueError, AttributeError, OSError):
+            return []
+
+    def _index(self, name, stat):
+        """Read a recipe file and replace what the catalog holds for it."""
+        rows, included = self._parse(name)
+        self._connection.execute("DELETE FROM recipes WHERE name = ?", (name,))
+        self._connection.execute("INSERT INTO recipes VALUES (?, ?, ?, ?, ?)",
+                                 (name, stat.st_mtime_ns, stat.st_size, rows is not None, len(rows or ())))
+        if rows:
+            # Each name is stored with its normalized key too, so it can be found however it is written.
+            self._connection.executemany("INSERT INTO ingredients VALUES (?, ?, ?, ?, ?)",
+                                         [(name, ingredient, normalize(ingredient), quantity, qualifier)
+                                          for ingredient, quantity, qualifier in rows])
+        self._connection.executemany("INSERT INTO includes VALUES (?, ?)", [(name, other) for other in included])
+
+    def refresh(self):
+        """Bring the catalog up to date, re-reading only files whose mtime or size changed (or that include one).
+
+        :return: the number of recipes that were (re)indexed
+        """
+        known = {name: (mtime_ns, size) for name, mtime_ns, size in
+                 self._connection.execute("SELECT name, mtime_ns, size FROM recipes")}
+        changed, stats = set(), {}
+        with self._connection:
+            for entry in os.scandir(self._full_directory):
+                # Hidden files hold the catalog itself and other bookkeeping.
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                stat = stats[entry.name] = entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if known.pop(entry.name, None) == signature:
+                    continue
+                self._index(entry.name, stat)
+                changed.add(entry.name)
+
+            # Anything left in known was deleted from the directory.
+            self._connection.executemany("DELETE FROM recipes WHERE name = ?", [(name,) for name in known])
+
+            # Recipes including a changed recipe changed too, though their own files didn't. Includes are stored
+            # through every level for recipes that expand, but only the first level for ones that don't, so look
+            # again for recipes including those indexed until there are none.
+            includes = self._connection.execute("SELECT recipe, included FROM includes").fetchall()
+            touched, including = changed | known.keys(), set()
+            while touched:
+                found = {name for name, included in includes if included in touched} - changed - including
+                for name in found:
+                    self._index(name, stats[name])
+                including |= found
+                touched = found
+        return len(changed) + len(including)
+
+    def names(self):
+        """Get the name of every valid recipe in the catalog.
+
+        :return: a sorted list of recipe names
+        """
+        return [name for name, in self._connection.execute(
+            "SELECT name FROM recipes WHERE valid ORDER BY name")]
+
+    def find_by_name(self, text):
+        """Find recipes whose name contains some text.
+
+        :param text: the text to search for (case-insensitive)
+        :return: a sorted list of recipe names
+        """
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return [name for name, in self._connection.execute(
+            "SELECT name FROM recipes WHERE valid AND name LIKE ? ESCAPE '\\' ORDER BY name", (pattern,))]
+
+    def find_by_ingredient(self, ingredient):
+        """Find recipes that use an ingredient.
+
+        :param ingredient: the name of the ingredient, written any way ("onion" finds recipes using "Onions")
+        :return: a sorted list of recipe names
+        """
+        return [name for name, in self._connection.execute(
+            "SELECT DISTINCT recipe FROM ingredients WHERE key = ? ORDER BY recipe", (normalize(ingredient),))]
+
+    def ingredient_names(self):
+        """Get the name of every ingredient used by a recipe in the catalog.
+
+        :return: a sorted list of ingredient names
+        """
+        return [name for name, in self._connection.execute(
+            "SELECT DISTINCT name FROM ingredients ORDER BY name")]
+
+    def ingredient_rows(self):
+        """Get the name of every ingredient of every valid recipe in the catalog, a recipe at a time.
+
+        :return: an iterator of (recipe, ingredient) pairs, ordered by recipe
+        """
+        return self._connection.execute("SELECT recipe, name FROM ingredients ORDER BY recipe")
+
+    def get_ingredients(self, name):
+        """Get the ingredients of a recipe from the index.
+
+        :param name: the name of the recipe
+        :return: a dict of ingredient name to (quantity, qualifier) tuples
+        """
+        return {ingredient: (quantity, qualifier) for ingredient, quantity, qualifier in self._connection.execute(
+            "SELECT name, quantity, qualifier FROM ingredients WHERE recipe = ?", (name,))}
+
+
+if __name__ == "__main__":
+    catalog = Catalog()
+    print("Indexed {} changed recipes.".format(catalog.refresh()))
+    for recipe_name in catalog.names():
+        print(recipe_name)
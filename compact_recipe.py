@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import os.path as pth
+import tempfile
+import tracemalloc
+from array import array
+from json import dump
+import units
+from recipe import Recipe, numpy
+
+
+class StringTable:
+    """Interns strings so each distinct name is stored once and referred to by a small id."""
+    __slots__ = ('_ids', '_strings')
+
+    def __init__(self):
+        """Initialize an empty table."""
+        self._ids = {}
+        self._strings = []
+
+    def intern(self, string):
+        """Get the id of a string, adding it to the table if it is new.
+
+        :param string: the string to intern
+        :return: the id of the string
+        """
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = self._ids[string] = len(self._strings)
+            self._strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self._strings[string_id]
+
+    def __len__(self):
+        return len(self._strings)
+
+# Tables shared by every compact recipe, so a name used by many recipes is only stored once.
+ingredient_names = StringTable()
+qualifiers = StringTable()
+
+
+class CompactRecipe(Recipe):
+    """Recipe stored as columns of interned ids and quantities, for very large lists.
+
+    _ingredients maps each name to its row; the row's name id, quantity and qualifier id are kept in arrays.
+    """
+    __slots__ = ('_names', '_quantities', '_qualifiers')
+
+    def __init__(self):
+        """Initialize a blank recipe."""
+        super().__init__()
+        self._names = array('I')
+        self._quantities = array('d')
+        self._qualifiers = array('I')
+
+    @staticmethod
+    def create_from_file(filename):
+        """Create a compact recipe using a previously-created file.
+
+        :param filename: the name of the file to load
+        :return: a new recipe read from the file
+        """
+        new_recipe = CompactRecipe()
+        return new_recipe.read_from_file(filename)
+
+    def items(self):
+        """Get every ingredient with its quantity.
+
+        :return: an iterator of (name, (quantity, qualifier)) pairs
+        """
+        quantities, qualifier_ids = self._quantities, self._qualifiers
+        for name, row in self._ingredients.items():
+            quantity = quantities[row]
+            yield name, (int(quantity) if quantity.is_integer() else quantity, qualifiers[qualifier_ids[row]])
+
+    def add_ingredient(self, name, quantity, qualifier):
+        """Add ingredient to the recipe, or update quantity of ingredient.
+
+        :param name: the name of the ingredient
+        :param quantity: the quantity of the ingredient
+        :param qualifier: the type of quantity of the ingredient (ounces, pounds, etx)
+        :return: a reference to the recipe
+        :raise ValueError: if the quantity can't be converted to the qualifier already in the recipe
+        """
+        stored, key = self._lookup(name)
+        if stored is None:
+            name = self._new_name(name, key)
+            self._append(name, quantity, qualifier)
+            if self._listeners:
+                self._notify('set', name, None, (quantity, qualifier))
+            return self
+
+        if stored != name:
+            self.merged += 1
+        name, row = stored, self._ingredients[stored]
+        current = self.get_ingredient_quantity(name) if self._listeners else None
+        current_qualifier = qualifiers[self._qualifiers[row]]
+        if current_qualifier == qualifier:
+            self._quantities[row] += quantity
+        else:
+            factor = units.registry.factor(qualifier, current_qualifier, name)
+            if factor is None:
+                raise ValueError("Attempting to add two different quantities failed.")
+            self._quantities[row] += quantity*factor
+
+        if self._listeners:
+            self._notify('set', name, current, self.get_ingredient_quantity(name))
+        return self
+
+    def set_ingredient(self, name, quantity, qualifier):
+        """Set the quantity of an ingredient, replacing any quantity already in the recipe.
+
+        :param name: the name of the ingredient
+        :param quantity: the quantity of the ingredient
+        :param qualifier: the type of quantity of the ingredient (ounces, pounds, etx)
+        :return: a reference to the recipe
+        """
+        stored, key = self._lookup(name)
+        current = None
+        if stored is None:
+            name = self._new_name(name, key)
+            self._append(name, quantity, qualifier)
+        else:
+            name, row = stored, self._ingredients[stored]
+            current = self.get_ingredient_quantity(name) if self._listeners else None
+            self._quantities[row] = quantity
+            self._qualifiers[row] = qualifiers.intern(qualifier)
+
+        if self._listeners:
+            self._notify('set', name, current, (quantity, qualifier))
+        return self
+
+    def _append(self, name, quantity, qualifier):
+        """Add a row for an ingredient that isn't in the recipe yet."""
+        # Store the table's copy of the name so every recipe shares one string.
+        name_id = ingredient_names.intern(name)
+        self._ingredients[ingredient_names[name_id]] = len(self._quantities)
+        self._names.append(name_id)
+        self._quantities.append(quantity)
+        self._qualifiers.append(qualifiers.intern(qualifier))
+
+    def remove_ingredient(self, name):
+        """Remove ingredient from recipe.
+
+        :param name: the ingredient to remove
+        :return: a copy of the removed ingredient
+        """
+        item = (name, self.get_ingredient_quantity(name))
+        name = self._stored_name(name)
+        row = self._ingredients.pop(name)
+        self._forget_name(name)
+
+        # Move the last row into the hole so the columns stay dense.
+        last = len(self._quantities) - 1
+        if row != last:
+            self._names[row] = self._names[last]
+            self._quantities[row] = self._quantities[last]
+            self._qualifiers[row] = self._qualifiers[last]
+            self._ingredients[ingredient_names[self._names[row]]] = row
+        del self._names[last], self._quantities[last], self._qualifiers[last]
+
+        if self._listeners:
+            self._notify('remove', name, item[1], None)
+        return item
+
+    def get_ingredient_quantity(self, name):
+        """Get the quantity of an ingredient.
+
+        :param name: the name of the ingredient
+        :return: a tuple of the quantity and qualifier of the ingredient
+        """
+        row = self._ingredients.get(name)
+        if row is None:
+            stored = self._stored_name(name)
+            if stored is None:
+                raise ValueError("No ingredient by that name.")
+            row = self._ingredients[stored]
+        quantity = self._quantities[row]
+        return int(quantity) if quantity.is_integer() else quantity, qualifiers[self._qualifiers[row]]
+
+    def read_from_file(self, filename):
+        """Read a file and load the recipe from it.
+
+        :param filename: the name of the file to be read (json dict or line-delimited)
+        :return: a reference to the recipe
+        """
+        return self.clear().merge_from_file(filename)
+
+    def _data(self):
+        """Get the recipe as a dict of name to (quantity, qualifier), as saved in json files."""
+        return dict(self.items())
+
+    def restore(self, ingredients):
+        """Replace every ingredient in the recipe at once.
+
+        Names are stored as add_ingredient() stores them, and names written differently that normalize to the same
+        key are merged.
+        :param ingredients: a dict of name to (quantity, qualifier)
+        :return: a reference to the recipe
+        """
+        old = self._data() if self._listeners else None
+        self._ingredients = {}
+        self._aliases = {}
+        self._names = array('I')
+        self._quantities = array('d')
+        self._qualifiers = array('I')
+        listeners, self._listeners = self._listeners, []
+        try:
+            for name, (quantity, qualifier) in ingredients.items():
+                try:
+                    self.add_ingredient(name, quantity, qualifier)
+                except ValueError:
+                    # Quantities that can't be converted are kept apart, under their own names (without surrounding
+                    # spaces, unless that is the name of the ingredient they couldn't be added to).
+                    name = name.strip() if name.strip() not in self._ingredients else name
+                    if name in self._ingredients:
+                        raise
+                    self._append(name, quantity, qualifier)
+        finally:
+            self._listeners = listeners
+
+        if self._listeners:
+            # Listeners are told the names the ingredients are stored under, not the names they were given.
+            self._notify('replace', None, old, self._data())
+        return self
+
+    def _replace(self, ingredients, aliases):
+        """Replace every ingredient at once (the columns are rebuilt, so aliases are worked out again)."""
+        return self.restore(ingredients)
+
+    def scale(self, factor):
+        """Multiply the quantity of every ingredient, as when changing the number of servings.
+
+        :param factor: the number to multiply by
+        :return: a reference to the recipe
+        """
+        old = self._data() if self._listeners else None
+        if numpy is not None:
+            # Multiply the column where it is, without boxing every quantity.
+            quantities = numpy.frombuffer(self._quantities, dtype=numpy.float64)
+            quantities *= factor
+            del quantities
+        else:
+            self._quantities = array('d', [quantity*factor for quantity in self._quantities])
+
+        if self._listeners:
+            self._notify('replace', None, old, self._data())
+        return self
+
+    def copy(self):
+        """Create a copy of the recipe.
+
+        :return: an identical copy of the recipe
+        """
+        # Columns are copied as flat buffers instead of re-adding every ingredient.
+        new_recipe = CompactRecipe()
+        new_recipe._ingredients = self._ingredients.copy()
+        new_recipe._aliases = self._aliases.copy()
+        new_recipe.merged = self.merged
+        new_recipe._names = array('I', self._names)
+        new_recipe._quantities = array('d', self._quantities)
+        new_recipe._qualifiers = array('I', self._qualifiers)
+        return new_recipe
+
+    def add_to(self, receiving_recipe):
+        """Add every ingredient in recipe to the shopping list.
+
+        :param receiving_recipe: the recipe to receive ingredients
+        :return: a reference to the receiving recipe
+        """
+        for ingredient, full_quantity in self.items():
+            receiving_recipe.add_ingredient(ingredient, full_quantity[0], full_quantity[1])
+        return receiving_recipe
+
+
+def compare_memory(recipe_count, ingredients_per_recipe, vocabulary=5000, recipe_types=(Recipe, CompactRecipe)):
+    """Measure the memory used to hold a collection of recipes loaded from files, in each kind of recipe.
+
+    :param recipe_count: the number of recipe files to load
+    :param ingredients_per_recipe: the number of ingredients in each recipe
+    :param vocabulary: the number of distinct ingredient names the recipes draw from
+    :param recipe_types: the recipe classes to compare
+    :return: a dict of class name to bytes held by the loaded recipes
+    """
+    units_used = ['cups', 'grams', 'whole', 'chopped', '']
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = []
+        for i in range(recipe_count):
+            filenames.append(pth.join(directory, str(i)))
+            with open(filenames[-1], "w") as write_file:
+                dump({"ingredient {}".format((i*7919 + j) % vocabulary): [j*0.5+0.25, units_used[j % len(units_used)]]
+                      for j in range(ingredients_per_recipe)}, write_file)
+
+        for recipe_type in recipe_types:
+            tracemalloc.start()
+            recipes = [recipe_type.create_from_file(filename) for filename in filenames]
+            results[recipe_type.__name__] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del recipes
+    return results
+
+if __name__ == "__main__":
+    print("Comparing memory used by Recipe and CompactRecipe (tables shared by every recipe are included)\n")
+    for count, size in ((1, 200000), (2000, 100)):
+        usage = compare_memory(count, size, vocabulary=max(5000, size))
+        print("{:>6} recipes of {:>7} ingredients: Recipe {:>7.1f} MiB, CompactRecipe {:>7.1f} MiB ({:.0%})".format(
+            count, size, usage['Recipe']/2**20, usage['CompactRecipe']/2**20,
+            usage['CompactRecipe']/usage['Recipe']))
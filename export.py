@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import argparse
+import csv
+import io
+import os.path as pth
+from contextlib import ExitStack
+from json import dumps, load
+import util
+from names import normalize
+
+# Optional map of the aisles of a store, in the order they are walked: {"aisle": ["ingredient", ...], ...}.
+AISLE_FILE = 'shopping_lists/aisles.json'
+
+# Heading of the ingredients that aren't in any aisle.
+OTHER_AISLE = 'Other'
+
+# Text collected for a file before it is written out, in characters.
+BUFFER_SIZE = 1 << 16
+
+
+class AisleMap:
+    """Index of which aisle each ingredient is in, for grouping and sorting lists the way a store is walked."""
+    def __init__(self, aisles):
+        """Index a map of aisles.
+
+        :param aisles: a dict of aisle name to a list of ingredient names, in the order the aisles are walked
+        :return: null
+        """
+        self.aisles = list(aisles) + [OTHER_AISLE]
+        # Normalized ingredient -> position of its aisle, so sorting never searches the aisles (and "onions" is found
+        # in the aisle listing "Onion").
+        self._rank = {}
+        for rank, aisle in enumerate(aisles):
+            for ingredient in aisles[aisle]:
+                self._rank.setdefault(normalize(ingredient), rank)
+
+    @classmethod
+    def load(cls, filename=AISLE_FILE):
+        """Read a map of aisles from a json file.
+
+        :param filename: the name of the file to read
+        :return: an AisleMap, or None if the file doesn't exist
+        """
+        path = pth.join(pth.dirname(__file__), filename)
+        if not pth.isfile(path):
+            return None
+        with open(path, "r") as read_file:
+            return cls(load(read_file))
+
+    def aisle(self, ingredient):
+        """Get the aisle an ingredient is in.
+
+        :param ingredient: the name of the ingredient, written any way
+        :return: the name of the aisle, or OTHER_AISLE
+        """
+        return self.aisles[self._rank.get(normalize(ingredient), len(self.aisles)-1)]
+
+    def order(self, recipe):
+        """Sort the ingredients of a recipe by aisle, then by name.
+
+        :param recipe: the recipe (or anything with items()) to sort
+        :return: a list of (aisle, name, (quantity, qualifier)) tuples
+        """
+        other = len(self.aisles)-1
+        keyed = [(self._rank.get(normalize(name), other), name.lower(), name, value) for name, value in recipe.items()]
+        keyed.sort(key=lambda entry: entry[:2])
+        return [(self.aisles[rank], name, value) for rank, _, name, value in keyed]
+
+
+class TextFormat:
+    """Plain text, one ingredient per line as show_ingredient() shows it."""
+    def start(self, out):
+        pass
+
+    def heading(self, out, aisle, first):
+        out.write(('' if first else '\n') + aisle + ':\n')
+
+    def line(self, out, shown, name, quantity, qualifier, aisle):
+        out.write(('  ' if aisle is not None else '') + shown + '\n')
+
+    def end(self, out):
+        pass
+
+
+class MarkdownFormat(TextFormat):
+    """Markdown checklist, with a heading per aisle."""
+    def heading(self, out, aisle, first):
+        out.write(('' if first else '\n') + '## ' + aisle + '\n\n')
+
+    def line(self, out, shown, name, quantity, qualifier, aisle):
+        out.write('- [ ] ' + shown + '\n')
+
+
+class CSVFormat:
+    """CSV with a header row, holding quantities as stored rather than as shown."""
+    def start(self, out):
+        self._writer = csv.writer(out, lineterminator='\n')
+        self._writer.writerow(['aisle', 'name', 'quantity', 'qualifier'])
+
+    def heading(self, out, aisle, first):
+        pass
+
+    def line(self, out, shown, name, quantity, qualifier, aisle):
+        self._writer.writerow([aisle or '', name, quantity, qualifier])
+
+    def end(self, out):
+        pass
+
+
+class JSONFormat:
+    """Json dict of name to [quantity, qualifier], as read by Recipe.read_from_file."""
+    def start(self, out):
+        self._separator = ''
+        out.write('{')
+
+    def heading(self, out, aisle, first):
+        pass
+
+    def line(self, out, shown, name, quantity, qualifier, aisle):
+        out.write(self._separator + dumps(name) + ': ' + dumps([quantity, qualifier]))
+        self._separator = ', '
+
+    def end(self, out):
+        out.write('}')
+
+
+class NDJSONFormat(JSONFormat):
+    """One [name, quantity, qualifier] record per line, as read by Recipe.read_from_file."""
+    def start(self, out):
+        pass
+
+    def line(self, out, shown, name, quantity, qualifier, aisle):
+        out.write(dumps([name, quantity, qualifier]) + '\n')
+
+    def end(self, out):
+        pass
+
+
+# Each format and the class that writes it.
+FORMATS = {
+    'text': TextFormat,
+    'markdown': MarkdownFormat,
+    'csv': CSVFormat,
+    'json': JSONFormat,
+    'ndjson': NDJSONFormat,
+}
+
+# Formats picked by the extension of the file written, otherwise text.
+EXTENSIONS = {'.md': 'markdown', '.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson'}
+
+
+def format_for(filename):
+    """Pick the format of a file from its extension.
+
+    :param filename: the name of the file
+    :return: the name of a format in FORMATS
+    """
+    return EXTENSIONS.get(pth.splitext(filename)[1].lower(), 'text')
+
+
+def export(recipe, targets, aisles=None, append=False):
+    """Write a recipe to several files in one pass over its ingredients.
+
+    Each file's text is collected in a buffer and written in large pieces. Rewritten files only replace the old ones
+    once every file has been fully written.
+    :param recipe: the recipe (or anything with items() and show_ingredient()) to write
+    :param targets: a list of (filename, format) pairs, format being a name in FORMATS
+    :param aisles: an AisleMap to group and sort ingredients by (optional, default: ingredients in recipe order)
+    :param append: whether to add to the end of the files instead of rewriting them
+    :return: a reference to the recipe
+    """
+    writers = [FORMATS[file_format]() for _, file_format in targets]
+    # Shown text is only worked out if a format uses it.
+    shows = any(isinstance(writer, TextFormat) for writer in writers)
+    if aisles is not None:
+        entries = aisles.order(recipe)
+    else:
+        entries = ((None, name, value) for name, value in recipe.items())
+
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(pth.join(pth.dirname(__file__), filename), "a")) if append else
+                 stack.enter_context(util.atomic_write(pth.join(pth.dirname(__file__), filename)))
+                 for filename, _ in targets]
+        # Formats write into a buffer per file, which is written out whenever the first one fills up.
+        buffers = [io.StringIO() for _ in targets]
+        outputs = list(zip(writers, buffers))
+        for writer, buffer in outputs:
+            writer.start(buffer)
+
+        current = None
+        for aisle, name, (quantity, qualifier) in entries:
+            shown = recipe.show_ingredient(name) if shows else None
+            if aisle != current:
+                # Entries are sorted by aisle, so each aisle's heading is only written once.
+                for writer, buffer in outputs:
+                    writer.heading(buffer, aisle, current is None)
+                current = aisle
+            for writer, buffer in outputs:
+                writer.line(buffer, shown, name, quantity, qualifier, aisle)
+
+            if buffers[0].tell() > BUFFER_SIZE:
+                for write_file, buffer in zip(files, buffers):
+                    write_file.write(buffer.getvalue())
+                    buffer.seek(0)
+                    buffer.truncate()
+
+        for (writer, buffer), write_file in zip(outputs, files):
+            writer.end(buffer)
+            write_file.write(buffer.getvalue())
+    return recipe
+
+
+def save_list(shopping_list, filename, aisles=None):
+    """Save a shopping list for both user and computer use, in one pass.
+
+    The list is saved to shopping_lists in the format its extension picks (grouped by aisle if the aisle file exists)
+    and to shopping_lists/data as line-delimited json, which the app can load again.
+    :param shopping_list: the recipe to save
+    :param filename: the name of the file to save
+    :param aisles: an AisleMap to group the readable list by (optional, default: read from AISLE_FILE)
+    :return: a reference to the shopping list
+    """
+    if aisles is None:
+        aisles = AisleMap.load()
+    return export(shopping_list, [('shopping_lists/' + filename, format_for(filename)),
+                                  ('shopping_lists/data/' + filename, 'ndjson')], aisles)
+
+
+def main(args=None):
+    # Imported here, as recipe.py imports this module.
+    from recipe import Recipe
+
+    parser = argparse.ArgumentParser(description="Write a recipe or list in other formats.")
+    parser.add_argument('input', help="recipe or list file to read")
+    parser.add_argument('outputs', nargs='+',
+                        help="files to write, each in the format its extension picks ({} or text)".format(
+                            ', '.join(sorted(EXTENSIONS))))
+    parser.add_argument('-a', '--aisles', help="json file of aisles to group by (default: {} if it exists)".format(
+        AISLE_FILE))
+    args = parser.parse_args(args)
+
+    recipe = Recipe.create_from_file(pth.abspath(args.input))
+    aisles = AisleMap.load(pth.abspath(args.aisles)) if args.aisles else AisleMap.load()
+    export(recipe, [(pth.abspath(output), format_for(output)) for output in args.outputs], aisles)
+    for output in args.outputs:
+        print("{}: {} ingredients -> {}".format(args.input, len(recipe), output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+__author__ = 'Kellan Childers'
+
+from collections import deque
+
+
+# Name of the changes in a step that were made outside the recipe (see History.record()).
+ACTION = object()
+
+
+class History:
+    """Undo and redo for a recipe, kept as a log of the changes made rather than copies of the recipe.
+
+    Changes made between begin() and end() are undone together as one step.
+    """
+    def __init__(self, recipe, max_changes=100000):
+        """Start recording the changes made to a recipe.
+
+        :param recipe: the recipe to record
+        :param max_changes: the most changes kept (a change replacing the whole recipe counts every ingredient);
+         the oldest steps are forgotten past this
+        :return: null
+        """
+        self._recipe = recipe
+        self.max_changes = max_changes
+
+        # Steps oldest first, each a list of (name, old, new) changes in the order they were made.
+        # A name of None means the whole recipe was replaced, with old and new dicts of every ingredient, and a name
+        # of ACTION means something outside the recipe changed, with old and new functions to take it back or redo it.
+        self._undo = deque()
+        self._redo = []
+        self._size = 0
+
+        # The step being recorded, how deeply begin() has been called, and whether a step is being undone.
+        self._step = []
+        self._depth = 0
+        self._applying = False
+
+        recipe.add_listener(self.on_change)
+
+    def __len__(self):
+        return len(self._undo)
+
+    @property
+    def can_redo(self):
+        """Whether there is an undone step to redo."""
+        return bool(self._redo)
+
+    @staticmethod
+    def _cost(step):
+        """Count the changes in a step."""
+        return sum(len(old) + len(new) if name is None else 1 for name, old, new in step)
+
+    def record(self, undo, redo):
+        """Record a change made alongside the recipe's (such as to what the recipe was built from).
+
+        :param undo: a function taking the change back
+        :param redo: a function making the change again
+        :return: a reference to the history
+        """
+        self._step.append((ACTION, undo, redo))
+        if not self._depth:
+            self._finish_step()
+        return self
+
+    def on_change(self, action, name, old, new):
+        """Record a change to the recipe (see Recipe.add_listener)."""
+        if self._applying:
+            return
+        if action == 'replace':
+            # Copied, as the recipe may keep the dicts it passes and change them in place afterwards.
+            self._step.append((None, dict(old), dict(new)))
+        else:
+            self._step.append((name, old, new))
+        if not self._depth:
+            # Changes made outside begin() and end() are a step of their own.
+            self._finish_step()
+
+    def begin(self):
+        """Start grouping changes into one step (calls may be nested).
+
+        :return: a reference to the history
+        """
+        self._depth += 1
+        return self
+
+    def end(self):
+        """Finish the step started by the matching begin().
+
+        :return: a reference to the history
+        """
+        self._depth -= 1
+        if not self._depth:
+            self._finish_step()
+        return self
+
+    def _finish_step(self):
+        """Save the step being recorded, if anything changed, and forget what was undone."""
+        if not self._step:
+            return
+        step, self._step = self._step, []
+        self._undo.append(step)
+        self._size += self._cost(step)
+        for undone in self._redo:
+            self._size -= self._cost(undone)
+        self._redo.clear()
+
+        # Forget the oldest steps until the history fits its budget.
+        while self._size > self.max_changes and self._undo:
+            self._size -= self._cost(self._undo.popleft())
+
+    def forget(self):
+        """Forget every step, including the one being recorded, so none can be undone or redone.
+
+        :return: a reference to the history
+        """
+        self._undo.clear()
+        self._redo.clear()
+        self._step = []
+        self._size = 0
+        return self
+
+    def _apply(self, step, forward):
+        """Make the changes of a step to the recipe, or take them back."""
+        self._applying = True
+        try:
+            for name, old, new in (step if forward else reversed(step)):
+                target = new if forward else old
+                if name is ACTION:
+                    target()
+                elif name is None:
+                    # Copy, so the step still holds the recipe as it was if the recipe changes again.
+                    self._recipe.restore(dict(target))
+                elif target is None:
+                    self._recipe.remove_ingredient(name)
+                else:
+                    self._recipe.set_ingredient(name, target[0], target[1])
+        finally:
+            self._applying = False
+
+    def undo(self):
+        """Take back the last step.
+
+        :return: True if there was a step to undo
+        """
+        if not self._undo:
+            return False
+        step = self._undo.pop()
+        self._apply(step, False)
+        self._redo.append(step)
+        return True
+
+    def redo(self):
+        """Make the last undone step again.
+
+        :return: True if there was a step to redo
+        """
+        if not self._redo:
+            return False
+        step = self._redo.pop()
+        self._apply(step, True)
+        self._undo.append(step)
+        return True
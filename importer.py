@@ -0,0 +1,366 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import argparse
+import csv
+import os
+import os.path as pth
+import re
+import shutil
+import sys
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from json import JSONDecodeError, JSONDecoder, dumps, loads
+from os import cpu_count
+from time import perf_counter
+from recipe import Recipe
+from units import parse_quantity
+
+# Directory imported recipes are saved in (relative to the app).
+DIRECTORY = 'saved_recipes'
+
+# Hidden directory inside DIRECTORY that recipes are written to before being moved into place.
+STAGING = '.import'
+
+# Records sent to a worker at a time.
+BATCH_SIZE = 500
+
+# Characters of a json dump read at a time.
+CHUNK_SIZE = 1 << 20
+
+# Longest recipe name saved, in bytes, leaving room in the file name limit for hidden bookkeeping files.
+MAX_NAME_BYTES = 200
+
+# Whitespace and commas between the records of a json array.
+_GAP = re.compile(r'[\s,]*')
+
+
+def read_json_array(read_file, chunk_size=CHUNK_SIZE):
+    """Read the records of a json array one at a time, without reading the whole file into memory.
+
+    :param read_file: the open file holding the array
+    :param chunk_size: the number of characters read at a time
+    :return: an iterator of records
+    :raise ValueError: if the file isn't a json array
+    """
+    decoder = JSONDecoder()
+    count = 0
+    buffer = read_file.read(chunk_size)
+    ended = not buffer
+    position = _GAP.match(buffer).end()
+    if buffer[position:position+1] != '[':
+        raise ValueError("Expected a json array of recipes")
+    position += 1
+
+    while True:
+        position = _GAP.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                # A record reaching the end of the buffer may continue in the next chunk.
+                if end < len(buffer) or ended:
+                    yield record
+                    count += 1
+                    position = end
+                    continue
+            except JSONDecodeError:
+                if ended:
+                    raise ValueError("Unreadable json after record {}".format(count))
+        elif ended:
+            raise ValueError("Dump ended before the array was closed")
+
+        # Keep the part of a record read so far and read the next chunk.
+        more = read_file.read(chunk_size)
+        ended = not more
+        buffer, position = buffer[position:] + more, 0
+
+
+def read_csv_rows(read_file):
+    """Read the recipes of a csv dump, a recipe being the consecutive rows with the same recipe name.
+
+    The header must name recipe, ingredient and quantity columns, and may name a qualifier (or unit) column.
+    :param read_file: the open csv file
+    :return: an iterator of records, as {"name": recipe, "ingredients": [[name, quantity, qualifier], ...]}
+    :raise ValueError: if a required column is missing
+    """
+    reader = csv.DictReader(read_file)
+    columns = {column.strip().lower(): column for column in reader.fieldnames or ()}
+    missing = [column for column in ('recipe', 'ingredient', 'quantity') if column not in columns]
+    if missing:
+        raise ValueError("Dump is missing the {} column(s)".format(', '.join(missing)))
+    recipe, ingredient, quantity = columns['recipe'], columns['ingredient'], columns['quantity']
+    qualifier = columns.get('qualifier', columns.get('unit'))
+
+    record = None
+    for row in reader:
+        if record is None or row[recipe] != record['name']:
+            if record is not None:
+                yield record
+            record = {'name': row[recipe], 'ingredients': []}
+        record['ingredients'].append([row[ingredient], row[quantity], row[qualifier] or '' if qualifier else ''])
+    if record is not None:
+        yield record
+
+
+def read_dump(read_file, filename):
+    """Read the records of a dump, in the format its extension (or first character) shows.
+
+    A .csv file is read by read_csv_rows(), a json array by read_json_array(), and anything else as one json record
+    per line. Lines are left as text, so workers parse them.
+    :param read_file: the open dump
+    :param filename: the name of the dump
+    :return: an iterator of records (dicts, or lines of json)
+    """
+    if filename.lower().endswith('.csv'):
+        return read_csv_rows(read_file)
+    first = read_file.read(1)
+    while first.isspace():
+        first = read_file.read(1)
+    read_file.seek(0)
+    if first == '[':
+        return read_json_array(read_file)
+    return (line for line in read_file if line.strip())
+
+
+def recipe_filename(name):
+    """Turn the name of an imported recipe into the name of its file.
+
+    :param name: the name of the recipe
+    :return: the name, with spacing collapsed and path separators replaced
+    :raise ValueError: if name can't be the name of a recipe
+    """
+    if not isinstance(name, str):
+        raise ValueError("bad name: {!r}".format(name))
+    filename = ' '.join(name.replace('/', '-').replace('\\', '-').split())
+    if not filename or filename.startswith('.') or not filename.isprintable():
+        raise ValueError("bad name: {!r}".format(name))
+    if len(filename.encode()) > MAX_NAME_BYTES:
+        raise ValueError("bad name: longer than {} bytes".format(MAX_NAME_BYTES))
+    return filename
+
+
+def _entries(ingredients):
+    """Read the ingredients of a record, as a dict of name to [quantity, qualifier] (or to a quantity), or as a list
+    of [name, quantity, qualifier] lists or {"name", "quantity", "qualifier" (or "unit")} dicts."""
+    if isinstance(ingredients, dict):
+        for name, value in ingredients.items():
+            if isinstance(value, list):
+                yield [name] + value
+            elif isinstance(value, dict):
+                yield [name, value.get('quantity'), value.get('qualifier', value.get('unit'))]
+            else:
+                yield [name, value]
+    elif isinstance(ingredients, list):
+        for entry in ingredients:
+            if isinstance(entry, dict):
+                yield [entry.get('name'), entry.get('quantity'), entry.get('qualifier', entry.get('unit'))]
+            elif isinstance(entry, list):
+                yield entry
+            else:
+                raise ValueError("bad ingredient: {!r}".format(entry))
+    else:
+        raise ValueError("no ingredients")
+
+
+def validate_record(record):
+    """Check a record and normalize its ingredients.
+
+    Quantities may be written as fractions (see units.parse_quantity), and ingredients listed under several
+    spellings are merged.
+    :param record: a dict with a name and ingredients, or a line of json holding one
+    :return: a tuple of the recipe's file name and the recipe
+    :raise ValueError: describing why the record was rejected, as "reason: details"
+    """
+    if isinstance(record, str):
+        try:
+            record = loads(record)
+        except JSONDecodeError as error:
+            raise ValueError("unreadable: {}".format(error))
+    if not isinstance(record, dict):
+        raise ValueError("not a recipe: {!r}".format(record)[:100])
+    filename = recipe_filename(record.get('name', record.get('title')))
+
+    recipe = Recipe()
+    for entry in _entries(record.get('ingredients')):
+        if not 2 <= len(entry) <= 3:
+            raise ValueError("bad ingredient: {!r}".format(entry))
+        name, quantity, qualifier = entry if len(entry) == 3 else entry + [None]
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("bad ingredient: {!r}".format(name))
+        if qualifier is not None and not isinstance(qualifier, str):
+            raise ValueError("bad qualifier: {}: {!r}".format(name, qualifier))
+        try:
+            quantity = parse_quantity(quantity)
+        except ValueError as error:
+            raise ValueError("bad quantity: {}: {}".format(name, error))
+        try:
+            recipe.add_ingredient(' '.join(name.split()), quantity, ' '.join((qualifier or '').lower().split()))
+        except ValueError as error:
+            raise ValueError("units don't match: {}".format(error))
+
+    if not len(recipe):
+        raise ValueError("no ingredients")
+    return filename, recipe
+
+
+def import_batch(batch, staging):
+    """Validate a batch of records and write the valid ones to the staging directory (run inside a worker process).
+
+    Either every valid recipe of the batch is written or, if writing fails, none are.
+    :param batch: a list of (record number, record) pairs
+    :param staging: the directory to write recipes to, each named by its record number
+    :return: a tuple of a list of (record number, file name, ingredient count) of the recipes written and a list of
+     (record number, name, reason) of the records rejected
+    """
+    written, rejected = [], []
+    try:
+        for number, record in batch:
+            try:
+                filename, recipe = validate_record(record)
+            except ValueError as error:
+                name = record.get('name', '') if isinstance(record, dict) else ''
+                rejected.append((number, name if isinstance(name, str) else '', str(error)))
+                continue
+            with open(pth.join(staging, str(number)), "w") as write_file:
+                write_file.write(dumps(dict(recipe.items())))
+            written.append((number, filename, len(recipe)))
+    except BaseException:
+        for number, _, _ in written:
+            os.remove(pth.join(staging, str(number)))
+        raise
+    return written, rejected
+
+
+def import_records(records, executor, workers, directory=DIRECTORY, batch_size=BATCH_SIZE, overwrite=False,
+                   on_reject=None):
+    """Validate and save a stream of records in parallel.
+
+    Records are sent to the workers in batches, a few batches per worker at a time, so a dump of any size is imported
+    in bounded memory. Workers write recipes to a hidden staging directory, and each is moved into place only once it
+    has been fully written, so an interrupted import never leaves half a recipe.
+    :param records: an iterator of records (see validate_record)
+    :param executor: the process pool used to validate and write the records
+    :param workers: the number of processes in the pool
+    :param directory: the directory to save recipes in (relative to the app)
+    :param batch_size: the number of records sent to a worker at a time
+    :param overwrite: whether to replace recipes already saved under the same name
+    :param on_reject: a function called with the record number, name and reason of each rejected record (optional)
+    :return: a tuple of the number of recipes saved and the number of ingredients they hold
+    """
+    full_directory = pth.join(pth.dirname(__file__), directory)
+    staging = pth.join(full_directory, STAGING)
+    # Anything left in staging is from an import that was interrupted.
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    existing = set() if overwrite else set(os.listdir(full_directory))
+    reject = on_reject or (lambda number, name, reason: None)
+
+    saved = ingredients = 0
+    # Names saved by this import, so only the first of several records with the same name is kept.
+    seen = set()
+
+    def finish(future, numbers):
+        nonlocal saved, ingredients
+        try:
+            written, rejected = future.result()
+        except OSError as error:
+            for number in numbers:
+                reject(number, '', "write failed: {}".format(error))
+            return
+        for number, name, reason in rejected:
+            reject(number, name, reason)
+        # Results are finished in the order records were read, so duplicates are decided the same way every time.
+        for number, filename, count in written:
+            temporary = pth.join(staging, str(number))
+            if filename in seen or filename in existing:
+                os.remove(temporary)
+                reject(number, filename, "duplicate: {} is earlier in the dump".format(filename) if filename in seen
+                       else "already saved: {}".format(filename))
+                continue
+            os.replace(temporary, pth.join(full_directory, filename))
+            seen.add(filename)
+            saved += 1
+            ingredients += count
+
+    try:
+        pending = deque()
+        batch = []
+        for number, record in enumerate(records, 1):
+            batch.append((number, record))
+            if len(batch) < batch_size:
+                continue
+            pending.append((executor.submit(import_batch, batch, staging), [number for number, _ in batch]))
+            batch = []
+            # A few batches per worker keeps the pool busy without reading the whole dump ahead.
+            if len(pending) > workers*2:
+                finish(*pending.popleft())
+        if batch:
+            pending.append((executor.submit(import_batch, batch, staging), [number for number, _ in batch]))
+        while pending:
+            finish(*pending.popleft())
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return saved, ingredients
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Import recipes from a json, line-delimited json or csv dump.")
+    parser.add_argument('dump', help="json array of recipes, file of one json recipe per line, or .csv file with "
+                                     "recipe, ingredient, quantity and qualifier columns")
+    parser.add_argument('-d', '--directory', default=DIRECTORY,
+                        help="directory to save recipes in (default: {})".format(DIRECTORY))
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count(),
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument('-b', '--batch-size', type=int, default=BATCH_SIZE,
+                        help="records sent to a worker at a time (default: {})".format(BATCH_SIZE))
+    parser.add_argument('--overwrite', action='store_true', help="replace recipes already saved with the same name")
+    parser.add_argument('-r', '--rejects', help="csv file to list each rejected record and why in")
+    args = parser.parse_args(args)
+
+    reasons = Counter()
+    rejects_file = open(args.rejects, "w", newline='', encoding='utf-8') if args.rejects else None
+    writer = csv.writer(rejects_file) if rejects_file else None
+    if writer:
+        writer.writerow(['record', 'name', 'reason'])
+
+    def on_reject(number, name, reason):
+        # Reasons are summarized by their kind, the part before any details.
+        reasons[reason.split(':', 1)[0]] += 1
+        if writer:
+            writer.writerow([number, name, reason])
+
+    unreadable = None
+
+    def records(read_file):
+        nonlocal unreadable
+        try:
+            yield from read_dump(read_file, args.dump)
+        except ValueError as error:
+            # The rest of the dump can't be read, but the records read before it are still saved.
+            unreadable = error
+
+    start = perf_counter()
+    try:
+        with open(pth.abspath(args.dump), "r", encoding='utf-8', newline='') as read_file, \
+                ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            saved, ingredients = import_records(records(read_file), executor, args.jobs, args.directory,
+                                                args.batch_size, args.overwrite, on_reject)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    elapsed = perf_counter() - start
+
+    records = saved + sum(reasons.values())
+    print("{}: {} records in {:.3f}s with {} workers ({:.1f} records/sec)".format(
+        args.dump, records, elapsed, args.jobs, records/elapsed if elapsed else 0.0))
+    print("Saved {} recipes ({} ingredients) to {}, rejected {}".format(
+        saved, ingredients, args.directory, sum(reasons.values())))
+    for reason, count in reasons.most_common():
+        print("  {}: {}".format(reason, count))
+    if unreadable is not None:
+        sys.exit("{}: {}".format(args.dump, unreadable))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+__author__ = 'Kellan Childers'
+
+import os
+import os.path as pth
+from json import dumps, loads
+from threading import Thread
+from recipe import Recipe
+
+
+def encode_change(action, name, old, new):
+    """Turn a recipe change (see Recipe.add_listener) into journal records.
+
+    Records hold the resulting quantity rather than the amount added, so replaying one twice is harmless.
+    :return: a list of records, each a list of ["set", name, quantity, qualifier], ["del", name] or ["clear"]
+    """
+    if action == 'set':
+        return [['set', name, new[0], new[1]]]
+    elif action == 'remove':
+        return [['del', name]]
+    return [['clear']] + [['set', name, quantity, qualifier] for name, (quantity, qualifier) in new.items()]
+
+
+def apply_record(recipe, record):
+    """Apply a journal record to a recipe.
+
+    :param recipe: the recipe to change
+    :param record: a record made by encode_change
+    :return: a reference to the recipe
+    """
+    if record[0] == 'set':
+        recipe.set_ingredient(record[1], record[2], record[3])
+    elif record[0] == 'del':
+        if record[1] in recipe:
+            recipe.remove_ingredient(record[1])
+    elif record[0] == 'clear':
+        recipe.clear()
+    return recipe
+
+
+class Journal:
+    """Append-only log of every change to a recipe, compacted into a snapshot once it grows too long.
+
+    The recipe is recovered by loading the snapshot, then replaying the log on top of it.
+    """
+    def __init__(self, recipe, filename, max_records=10000):
+        """Create a journal for a recipe.
+
+        :param recipe: the recipe to record
+        :param filename: the journal's file (the snapshot is saved next to it with .snapshot added)
+        :param max_records: the number of records after which the journal is compacted
+        :return: null
+        """
+        self._recipe = recipe
+        self._path = pth.join(pth.dirname(__file__), filename)
+        self._old_path = self._path + '.old'
+        self._snapshot_path = self._path + '.snapshot'
+        self.max_records = max_records
+        self._records = 0
+        self._file = None
+        self._compaction = None
+
+    def _read(self, path):
+        """Read the records in a journal file, skipping a last line cut short by a crash."""
+        if not pth.isfile(path):
+            return
+        with open(path, "r") as read_file:
+            for line in read_file:
+                try:
+                    yield loads(line)
+                except ValueError:
+                    continue
+
+    def recover(self):
+        """Read the last snapshot and every change logged since into a new recipe.
+
+        The journal's own recipe isn't touched, so this can run on a worker thread before attach().
+        :return: the recovered recipe
+        """
+        recovered = Recipe()
+        if pth.isfile(self._snapshot_path):
+            recovered.merge_from_file(self._snapshot_path)
+        # A journal left over from a compaction that didn't finish still holds changes newer than the snapshot.
+        for path in (self._old_path, self._path):
+            for record in self._read(path):
+                apply_record(recovered, record)
+                self._records += path == self._path
+
+        if pth.isfile(self._old_path):
+            # Finish the interrupted compaction now that the whole recipe is loaded.
+            self._save_snapshot(recovered)
+            for path in (self._path, self._old_path):
+                if pth.isfile(path):
+                    os.remove(path)
+            self._records = 0
+        return recovered
+
+    def replay(self):
+        """Load the last snapshot and every change logged since into the recipe.
+
+        Should be called before attach(), so replayed changes aren't logged again.
+        :return: a reference to the journal
+        """
+        self._recipe.restore(dict(self.recover().items()))
+        return self
+
+    def attach(self):
+        """Start logging every change made to the recipe.
+
+        :return: a reference to the journal
+        """
+        os.makedirs(pth.dirname(self._path), exist_ok=True)
+        self._file = open(self._path, "a")
+        self._recipe.add_listener(self.on_change)
+        return self
+
+    def on_change(self, action, name, old, new):
+        """Log a change to the recipe (see Recipe.add_listener)."""
+        for record in encode_change(action, name, old, new):
+            self._file.write(dumps(record) + '\n')
+            self._records += 1
+        self._file.flush()
+
+        if self._records >= self.max_records:
+            self.compact()
+
+    def compact(self):
+        """Start writing a snapshot of the recipe in the background, then drop the log it replaces.
+
+        :return: a reference to the journal
+        """
+        if pth.isfile(self._old_path):
+            # Last snapshot is still being written (or failed, leaving its log); try again after more changes.
+            return self
+
+        # Start a fresh log; the old one is kept until the snapshot holding its changes is safely written.
+        self._file.close()
+        os.replace(self._path, self._old_path)
+        self._file = open(self._path, "a")
+        self._records = 0
+
+        snapshot = self._recipe.copy()
+        self._compaction = Thread(target=self._write_snapshot, args=(snapshot,), daemon=True)
+        self._compaction.start()
+        return self
+
+    def _save_snapshot(self, snapshot):
+        """Save a snapshot atomically, in the binary format so the next start can read it quickly."""
+        # Imported here, so starting the app doesn't wait for it.
+        from binformat import save_binary
+        save_binary(snapshot, self._snapshot_path)
+
+    def _write_snapshot(self, snapshot):
+        """Save a snapshot, then delete the log it replaces (run on a background thread)."""
+        self._save_snapshot(snapshot)
+        os.remove(self._old_path)
+
+    def checkpoint(self):
+        """Save the whole recipe as the snapshot now and empty the log, so the next replay only reads the snapshot.
+
+        :return: a reference to the journal
+        """
+        if self._compaction is not None:
+            self._compaction.join()
+        self._save_snapshot(self._recipe)
+
+        # Everything logged is in the snapshot, so the logs can go (a crash before this just replays them again).
+        if self._file is not None:
+            self._file.close()
+            self._file = open(self._path, "w")
+        elif pth.isfile(self._path):
+            os.remove(self._path)
+        if pth.isfile(self._old_path):
+            os.remove(self._old_path)
+        self._records = 0
+        return self
+
+    def close(self):
+        """Stop logging and wait for any snapshot still being written.
+
+        :return: a reference to the journal
+        """
+        if self._file is not None:
+            self._recipe.remove_listener(self.on_change)
+            self._file.close()
+            self._file = None
+        if self._compaction is not None:
+            self._compaction.join()
+        return self
+
+if __name__ == "__main__":
+    shopping_list = Recipe()
+    journal = Journal(shopping_list, 'shopping_lists/data/.journal').replay()
+    print("Recovered list:")
+    shopping_list.print_to_console()
@@ -0,0 +1,135 @@
+__author__ = 'Kellan Childers'
+
+import curses
+import profiling
+from bisect import bisect_left, insort
+
+
+class ListView:
+    """Sorted, paged view of a recipe that only redraws the cells that changed."""
+    def __init__(self, window, recipe, top, left, rows, columns, column_width=20):
+        """Create a view of a recipe inside part of a window.
+
+        :param window: the curses window to draw in
+        :param recipe: the recipe to show (the view follows its changes)
+        :param top: the first row of the list in the window
+        :param left: the first column of the list in the window
+        :param rows: the number of rows in each column of the list
+        :param columns: the number of columns of the list
+        :param column_width: the width of each column (longer entries are truncated)
+        :return: null
+        """
+        self._window = window
+        self._recipe = recipe
+        self._top, self._left = top, left
+        self._rows, self._columns = max(1, rows), max(1, columns)
+        self._column_width = column_width
+        self.offset = 0
+
+        # Names in display order, and the formatted line of each name shown so far.
+        self._names = sorted(recipe)
+        self._lines = {}
+
+        # (row, column) -> text of everything drawn by the last render, or None to redraw everything.
+        self._painted = None
+
+        recipe.add_listener(self.on_change)
+
+    @property
+    def page_size(self):
+        """The number of ingredients shown at once."""
+        return self._rows * self._columns
+
+    def on_change(self, action, name, old, new):
+        """Keep the sorted names and formatted lines up to date with the recipe (see Recipe.add_listener)."""
+        if action == 'set':
+            self._lines.pop(name, None)
+            if old is None:
+                insort(self._names, name)
+        elif action == 'remove':
+            self._lines.pop(name, None)
+            del self._names[bisect_left(self._names, name)]
+        else:
+            self._names = sorted(new)
+            self._lines = {}
+
+    def invalidate(self):
+        """Forget what is on screen, so the next render draws every cell (call after clearing the window)."""
+        self._painted = None
+
+    def next_page(self):
+        """Scroll forward a page.
+
+        :return: a reference to the view
+        """
+        if self.offset + self.page_size < len(self._names):
+            self.offset += self.page_size
+        return self
+
+    def previous_page(self):
+        """Scroll back a page.
+
+        :return: a reference to the view
+        """
+        self.offset = max(0, self.offset - self.page_size)
+        return self
+
+    def _line(self, name):
+        """Get the formatted, truncated line for an ingredient."""
+        line = self._lines.get(name)
+        if line is None:
+            full_ingredient = self._recipe.show_ingredient(name)
+            # Truncate ingredient if it doesn't fit in its column.
+            limit = self._column_width - 2
+            line = full_ingredient[:limit] + (full_ingredient[limit:] and '..')
+            self._lines[name] = line = line.ljust(self._column_width)
+        return line
+
+    def frame(self, header):
+        """Work out what every cell of the list should hold, formatting only the visible ingredients.
+
+        :param header: the text to center above the list
+        :return: a dict of (row, column) to text
+        """
+        # Keep the offset on a page that still exists after removals.
+        if self.offset >= len(self._names):
+            self.offset = max(0, (len(self._names)-1) // self.page_size * self.page_size)
+
+        width = self._columns * self._column_width
+        pages = max(1, -(-len(self._names) // self.page_size))
+        if pages > 1:
+            header = "{} (page {}/{})".format(header, self.offset // self.page_size + 1, pages)
+        frame = {(self._top-1, self._left): header.center(width)[:width]}
+
+        visible = self._names[self.offset:self.offset+self.page_size]
+        for i, name in enumerate(visible):
+            column, row = divmod(i, self._rows)
+            frame[(self._top+row, self._left+column*self._column_width)] = self._line(name)
+        return frame
+
+    def render(self, header="Shopping list:"):
+        """Draw the changes since the last render into the window, without refreshing the screen.
+
+        :param header: the text to center above the list
+        :return: a reference to the view
+        """
+        frame = self.frame(header)
+        painted = self._painted or {}
+        drawn = 0
+        try:
+            for (y, x), text in frame.items():
+                if painted.get((y, x)) != text:
+                    self._window.addstr(y, x, text)
+                    drawn += 1
+            for (y, x) in painted.keys() - frame.keys():
+                self._window.addstr(y, x, ' '*len(painted[(y, x)]))
+                drawn += 1
+        except curses.error:
+            # Window is smaller than the list, so stop drawing.
+            pass
+        if profiling.enabled:
+            profiling.count('ListView cells drawn', drawn)
+            profiling.count('ListView cells unchanged', len(frame) - drawn)
+        self._painted = frame
+        self._window.noutrefresh()
+        return self
@@ -1,16 +1,62 @@
 __author__ = 'Kellan Childers'
 
 import curses
+import os
+import os.path as pth
+import profiling
 import util
+from json import dumps, loads
+from time import monotonic
+from export import save_list
+from journal import Journal
+from history import History
+from listview import ListView
+from pantry import Pantry
 from recipe import Recipe
+from search import CompletionIndex
+from units import parse_quantity
+
+# Where the list is journaled, and where the rest of the session is saved on exit.
+JOURNAL_FILE = 'shopping_lists/data/.journal'
+SESSION_FILE = 'shopping_lists/data/.session'
 
 
 class MainScreen:
-    def __init__(self, console_height, console_width):
+    # Lines of the help window, in the order they are shown.
+    HELP_LINES = [
+        "To add an item, press 'a'",
+        "To remove an item, press 'r'",
+        "To load a recipe, press 'l'",
+        "To load a recipe several times, press 'x'",
+        "To save as a recipe, press 'w'",
+        "To save as a shopping list, press 's'",
+        "To clear the list, press 'c'",
+        "To add an item to the pantry, press 'k'",
+        "To take the pantry off the list, press 'e'",
+        "To find recipes using an item, press 'f'",
+        "To find recipes you can make, press 'm'",
+        "To see the next/previous page, press 'n'/'p'",
+        "To undo/redo a change, press 'u'/'y'",
+        "To show performance stats, press 'o'",
+        "To quit, press 'q'",
+        "Otherwise, press 'h' to return to application",
+    ]
+
+    # How long to wait for a key before checking on background work, in milliseconds.
+    TICK = 100
+
+    # Frames of the spinner shown while background work runs.
+    SPINNER = '|/-\\'
+
+    # Most choices shown by pick(), each chosen with its number key.
+    MAX_CHOICES = 9
+
+    def __init__(self, console_height, console_width, shopping_list=None):
         """Create a main screen.
 
         :param console_height: the height of the console
         :param console_width: the width of the console
+        :param shopping_list: a RemoteRecipe to share a server's list (optional, default: a list of its own)
         :return: null
         """
         # List should be two smaller in each direction because of surrounding border.
@@ -20,37 +66,257 @@ class MainScreen:
         display_start_y, display_start_x = util.center_start(console_height, console_width,
                                                              self._list_height, self._list_width)
 
-        # Initialize a Recipe to serve as a shopping list.
-        self._shopping_list = Recipe()
+        # Initialize a Recipe to serve as a shopping list, unless the list is shared through a server.
+        self._remote = shopping_list is not None
+        self._shopping_list = shopping_list if self._remote else Recipe()
+
+        # Journal logging every change to the list so it can't be lost, set once the last session is restored
+        # (see start_restore()). A server keeps the journal of a shared list itself.
+        self._journal = None
+
+        # Index of saved recipes, opened on a thread of its own after the first paint (see start_indexing()), the
+        # catalog (or error) that thread hands over for poll_task() to pick up, and the error if indexing failed.
+        self._catalog = None
+        self._indexed = None
+        self._index_error = None
+
+        # Whether the last session is still being restored, and whether the list was cleared meanwhile.
+        self._restoring = False
+        self._cleared_while_restoring = False
+
+        # Each recipe loaded this session as [filename, times], saved with the session on exit.
+        self._loaded = []
+
+        # Names offered as completions in prompts: items on the list follow its changes, recipe files are
+        # re-listed when the directory changes, and catalog ingredients are indexed the first time they're needed.
+        self._item_index = CompletionIndex(self._shopping_list)
+        self._shopping_list.add_listener(self._item_index.on_change)
+        self._recipe_index = CompletionIndex()
+        self._recipe_directory_mtime = None
+        self._ingredient_index = None
+
+        # Every change to the list can be undone, one command at a time (a shared list can't be, as other
+        # terminals change it too).
+        self._history = None if self._remote else History(self._shopping_list)
+
+        # Ingredients already on hand, loaded the first time they're needed (see pantry()).
+        self._pantry = None
+
+        # Index of which saved recipes use which ingredients, built the first time recipes are matched and again
+        # whenever saved_recipes changes (the directory's mtime when it was built tells).
+        self._matcher = None
+        self._matcher_mtime = None
+
+        # Parsed recipes are kept so loading the same recipe again doesn't re-read the file (see recipe_cache()).
+        self._recipe_cache = None
+
+        # Files are read and written on a worker thread so the screen stays responsive, started with the first task.
+        # Only one task runs at a time: (future, description, start time, function to call with the result).
+        self._worker = None
+        self._task = None
 
         # Create window that will act as main visual.
         self._list_display = curses.newwin(self._list_height, self._list_width, display_start_y, display_start_x)
 
         # Add visual detail to window.
         self._list_display.bkgd(' ', curses.color_pair(1))
+        self._list_display.keypad(True)
         util.color_box(self._list_display, 0, 0, self._list_height-1, self._list_width-1, 3)
 
-        # Initializes help window for use in pause().
-        help_height, help_width = 12, 50
+        # Show the list in 20 character columns between the header and the status line.
+        self._view = ListView(self._list_display, self._shopping_list, 2, 1,
+                              self._list_height-4, (self._list_width-2)//20)
+
+        # Initializes help window for use in help().
+        help_height, help_width = len(self.HELP_LINES)+4, 50
         help_y, help_x = util.center_start(console_height, console_width, help_height, help_width)
         self.help_window = curses.newwin(help_height, help_width, help_y, help_x)
 
-    def add_recipe(self, filename):
-        """Load a recipe and add it to the shopping list.
+        # Performance overlay in the top right of the list, created while it is shown (see command_overlay()).
+        self._overlay = None
+
+        # Each command key and the method that handles it.
+        self._commands = {
+            'l': self.command_load_recipe,
+            'x': self.command_load_recipe_times,
+            'a': self.command_add_item,
+            'r': self.command_remove_item,
+            's': self.command_save_list,
+            'w': self.command_save_recipe,
+            'c': self.command_clear,
+            'k': self.command_stock_pantry,
+            'e': self.command_subtract_pantry,
+            'f': self.command_find,
+            'm': self.command_match,
+            'n': self.command_next_page,
+            'p': self.command_previous_page,
+            'u': self.command_undo,
+            'y': self.command_redo,
+            'o': self.command_overlay,
+            'h': self.help,
+            'q': self.quit,
+        }
+
+    def show_status(self, message):
+        """Show a message centered on the status line at the bottom of the list.
+
+        :param message: the message to show (truncated to fit)
+        :return: a reference to the main screen
+        """
+        width = self._list_width-2
+        message = message[:width-2] + (message[width-2:] and '..')
+        self._list_display.addstr(self._list_height-2, 1, message.center(width))
+        self._list_display.refresh()
+        return self
+
+    def show_lost_connection(self):
+        """Tell the user the server sharing the list has gone, so the list can only be viewed from now on.
+
+        :return: a reference to the main screen
+        """
+        return self.show_status("Lost connection to server, the list is read-only")
+
+    def show_index_pending(self):
+        """Tell the user the recipe catalog can't be used yet, or at all if indexing failed.
+
+        :return: a reference to the main screen
+        """
+        if self._index_error is not None:
+            return self.show_status("Could not index recipes: {}".format(self._index_error))
+        return self.show_status("Still indexing recipes, try again in a moment")
+
+    def show_loaded(self, filename, merged):
+        """Tell the user a file was loaded, and how many of its ingredients were merged into others.
+
+        :param filename: the name of the file loaded
+        :param merged: the number of ingredients merged because they were written differently
+        :return: a reference to the main screen
+        """
+        if merged:
+            return self.show_status("{} fully loaded, {} duplicate names merged".format(filename, merged))
+        return self.show_status("{} fully loaded".format(filename))
+
+    def run_in_background(self, description, work, on_done):
+        """Run slow work (reading or writing files) on the worker thread.
+
+        on_done is called on the main thread by poll_task() with the result of work, or with the exception it raised.
+        :param description: what to show on the status line while the work runs
+        :param work: a function taking no arguments
+        :param on_done: a function taking the result of work
+        :return: True if the work was started, or False if other work is still running
+        """
+        if self._task is not None:
+            self.show_status("Still busy, try again in a moment")
+            return False
+        if self._worker is None:
+            # Imported here, so starting the app doesn't wait for it.
+            from concurrent.futures import ThreadPoolExecutor
+            self._worker = ThreadPoolExecutor(max_workers=1)
+        self._task = (self._worker.submit(work), description, monotonic(), on_done)
+        return True
+
+    def poll_task(self):
+        """Show progress of background work, and finish it on the main thread once it is done.
+
+        :return: True if background work is still running
+        """
+        if self._indexed is not None:
+            indexed, self._indexed = self._indexed, None
+            if isinstance(indexed, Exception):
+                self._index_error = indexed
+                self.show_status("Could not index recipes: {}".format(indexed))
+            else:
+                self._catalog = indexed
+                # Anything matched before was matched against the old index.
+                self._matcher = None
+
+        if self._task is None:
+            return False
+
+        future, description, started, on_done = self._task
+        if not future.done():
+            elapsed = monotonic() - started
+            spinner = self.SPINNER[int(elapsed*10) % len(self.SPINNER)]
+            self.show_status("{} {} {:.1f}s".format(description, spinner, elapsed))
+            return True
+
+        self._task = None
+        error = future.exception()
+        if isinstance(error, ConnectionError) and self._remote:
+            self.show_lost_connection()
+            return False
+        self._begin_step()
+        try:
+            on_done(future.result() if error is None else error)
+        finally:
+            self._end_step()
+        return False
+
+    def is_busy(self):
+        """Tell the user if background work is still running, so they aren't asked for anything it would throw away.
+
+        :return: True if background work is still running
+        """
+        if self.poll_task():
+            self.show_status("Still busy, try again in a moment")
+            return True
+        return False
+
+    def wait_for_task(self):
+        """Block until background work is finished, showing progress meanwhile.
+
+        :return: a reference to the main screen
+        """
+        while self.poll_task():
+            curses.napms(self.TICK)
+        return self
+
+    def add_recipe(self, filename, times=1):
+        """Load a recipe in the background and add it to the shopping list once it is read.
 
         :param filename: the recipe (located in saved_recipes) to be loaded
-        :return: null
+        :param times: how many times over to add the recipe (for more or fewer servings)
+        :return: True if loading started
         """
         # Add the directory name to the filename.
         filename = 'saved_recipes/' + filename
 
-        new_recipe = Recipe.create_from_file(filename)
-        # Add ingredients to the shopping list.
-        new_recipe.add_to(self._shopping_list)
-
-        # Alert user that list was updated.
-        self._list_display.addstr(self._list_height-2, 1, "{} fully loaded".format(filename))
-        self._list_display.refresh()
+        def finish(new_recipe):
+            if not isinstance(new_recipe, Exception):
+                # Remember the recipe for the next session (even if it only partly loaded).
+                self._loaded.append([pth.basename(filename), times])
+            if isinstance(new_recipe, (FileNotFoundError, IsADirectoryError)):
+                self.show_status("File not found")
+            elif isinstance(new_recipe, ValueError) and self._remote:
+                self.show_status("{} only partly loaded, units didn't match".format(filename))
+            elif isinstance(new_recipe, ValueError):
+                # Say what was wrong, such as recipes including each other.
+                self.show_status("Could not read {}: {}".format(filename, new_recipe))
+            elif isinstance(new_recipe, Exception):
+                self.show_status("Could not read {}".format(filename))
+            elif self._remote:
+                # Server has already added the recipe to the shared list.
+                self.show_status("{} fully loaded".format(filename))
+            else:
+                # Add ingredients to the shopping list.
+                merged = self._shopping_list.merged
+                try:
+                    if times == 1:
+                        new_recipe.add_to(self._shopping_list)
+                    else:
+                        self._shopping_list.add_weighted([(new_recipe, times)])
+                except ValueError:
+                    self.show_status("{} only partly loaded, units didn't match".format(filename))
+                    return
+                # Alert user that list was updated.
+                self.show_loaded(filename, new_recipe.merged + self._shopping_list.merged - merged)
+
+        if self._remote:
+            # Server reads the recipe through the cache it shares between every terminal.
+            return self.run_in_background("Loading {}".format(filename),
+                                          lambda: self._shopping_list.load(filename, times), finish)
+        return self.run_in_background("Loading {}".format(filename),
+                                      lambda: self.recipe_cache().load(filename), finish)
 
     def add_item(self, name, quantity, qualifier):
         """Add a single item to the shopping list.
@@ -71,10 +337,73 @@ class MainScreen:
         """
         return self._shopping_list.remove_ingredient(name)
 
-    def request_element(self, request):
+    def find_recipes(self, ingredient):
+        """Show the saved recipes that use an ingredient.
+
+        :param ingredient: the name of the ingredient to look for
+        :return: a list of the names of the recipes found
+        """
+        if self._catalog is None:
+            self.show_index_pending()
+            return []
+        found = self._catalog.find_by_ingredient(ingredient)
+        self.show_status("Found: " + ', '.join(found) if found else "No recipes use {}".format(ingredient))
+        return found
+
+    def recipe_index(self):
+        """Get the completion index of saved recipe files, re-listing the directory only if it changed.
+
+        :return: a CompletionIndex of recipe filenames
+        """
+        directory = pth.join(pth.dirname(__file__), 'saved_recipes')
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._recipe_directory_mtime:
+            self._recipe_directory_mtime = mtime
+            # Skip hidden files such as the catalog database.
+            self._recipe_index.rebuild(name for name in (os.listdir(directory) if mtime is not None else ())
+                                       if not name.startswith('.'))
+        return self._recipe_index
+
+    def ingredient_index(self):
+        """Get the completion index of every ingredient in the catalog, building it the first time.
+
+        :return: a CompletionIndex of ingredient names (empty until the catalog is open)
+        """
+        if self._catalog is None:
+            return CompletionIndex()
+        if self._ingredient_index is None:
+            self._ingredient_index = CompletionIndex(self._catalog.ingredient_names())
+        return self._ingredient_index
+
+    def recipe_cache(self):
+        """Get the cache of parsed recipes, creating it the first time.
+
+        :return: the RecipeCache
+        """
+        if self._recipe_cache is None:
+            # Imported here, so starting the app doesn't wait for it.
+            from cache import RecipeCache
+            self._recipe_cache = RecipeCache()
+        return self._recipe_cache
+
+    def pantry(self):
+        """Get the pantry, loading it the first time.
+
+        :return: the Pantry
+        """
+        if self._pantry is None:
+            self._pantry = Pantry().load()
+        return self._pantry
+
+    def request_element(self, request, completions=None):
         """Ask for an element.
 
+        With completions, the best matches are shown after the text on every keystroke and tab accepts the first.
         :param request: the request for the element (requires string)
+        :param completions: a CompletionIndex of likely answers (optional)
         :return: the user's response
         """
         # Clear row in preparation of getting element.
@@ -82,83 +411,159 @@ class MainScreen:
 
         # Format request, then request.
         _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, len(request))
+        if completions is not None:
+            # Leave room for the answer and its suggestions.
+            line_x = min(line_x, 2)
         self._list_display.addstr(self._list_height-2, line_x, request)
         self._list_display.refresh()
 
-        # Get element.
-        curses.echo()
-        element = self._list_display.getstr().decode(encoding="utf-8")
-        curses.noecho()
+        # Get element, waiting for the user instead of timing out like the main loop.
+        self._list_display.timeout(-1)
+        if completions is None:
+            curses.echo()
+            element = self._list_display.getstr().decode(encoding="utf-8")
+            curses.noecho()
+        else:
+            element = self._read_with_completions(line_x + len(request), completions)
+        self._list_display.timeout(self.TICK)
 
         return element
 
+    def _read_with_completions(self, text_x, completions):
+        """Read a line of text one key at a time, showing ranked completions as it is typed.
+
+        :param text_x: the column the text starts at on the status line
+        :param completions: a CompletionIndex of likely answers
+        :return: the text entered
+        """
+        text, matches = '', []
+        width = self._list_width-1 - text_x
+        while True:
+            # Show the text followed by the best matches, then put the cursor back at the end of the text.
+            line = text + ('  [' + ' | '.join(matches) + ']' if matches else '')
+            self._list_display.addstr(self._list_height-2, text_x, line[:width-1].ljust(width-1))
+            self._list_display.move(self._list_height-2, min(text_x + len(text), self._list_width-2))
+            self._list_display.refresh()
+
+            key = self._list_display.get_wch()
+            if key in ('\n', '\r', curses.KEY_ENTER):
+                return text
+            elif key in ('\b', '\x7f', curses.KEY_BACKSPACE):
+                text = text[:-1]
+            elif key == '\t':
+                # Accept the best match.
+                if matches:
+                    text = matches[0]
+            elif isinstance(key, str) and key.isprintable():
+                text += key
+            else:
+                # Ignore other special keys.
+                continue
+            matches = completions.complete(text)
+
+    def _save_in_background(self, description, save):
+        """Save a snapshot of the shopping list on the worker thread.
+
+        :param description: what is being saved, for the status line
+        :param save: a function taking the snapshot and saving it
+        :return: True if saving started
+        """
+        # Copy first, so the list can keep changing while the copy is written (a server copies its own list).
+        snapshot = None if self._remote else self._shopping_list.copy()
+
+        def finish(result):
+            if isinstance(result, Exception):
+                self.show_status("File unable to be saved")
+            else:
+                self.show_status("{} saved".format(description))
+
+        return self.run_in_background("Saving {}".format(description), lambda: save(snapshot), finish)
+
     def save_list(self, filename):
         """Save a copy of the shopping list for both user and computer use.
 
-        Data will be saved to shopping_lists/data as json file and to shopping_lists as human-readable list.
+        Data will be saved to shopping_lists/data as line-delimited json and to shopping_lists as human-readable list
+        (in the format its extension picks, grouped by aisle if export.AISLE_FILE exists).
         :param filename: the name of the file to save
-        :return: a reference to the main screen
+        :return: True if saving started
         """
-        # Add appropriate directory name for each place to save.
-        data_name = 'shopping_lists/data/' + filename
-        filename = 'shopping_lists/' + filename
+        # Name the readable list in the status line.
+        list_name = 'shopping_lists/' + filename
 
-        # Save twice to allow reference later on.
-        self._shopping_list.save_as_list(filename)
-        self._shopping_list.save_to_file(data_name)
+        if self._remote:
+            # Server saves its own copy of the shared list.
+            return self._save_in_background(list_name, lambda _: self._shopping_list.save_list(filename))
 
-        return self
+        # Save in both places in one pass over the list, to allow reference later on.
+        return self._save_in_background(list_name, lambda snapshot: save_list(snapshot, filename))
 
     def save_as_recipe(self, filename):
-        """Save a copy of the shopping list for both user and computer use.
+        """Save a copy of the shopping list as a recipe.
 
-        Data will be saved to shopping_lists/data as json file and to shopping_lists as human-readable list.
+        Data will be saved to saved_recipes as a json file.
         :param filename: the name of the file to save
-        :return: a reference to the main screen
+        :return: True if saving started
         """
         # Add appropriate directory name to save as recipe.
         filename = 'saved_recipes/' + filename
 
-        # Save as a recipe.
-        self._shopping_list.save_to_file(filename)
+        # The new recipe may be one that can be made, so match against the saved recipes again next time.
+        self._matcher = None
 
-        return self
+        # Save as a recipe.
+        if self._remote:
+            return self._save_in_background(filename, lambda _: self._shopping_list.save_as_recipe(
+                pth.basename(filename)))
+        return self._save_in_background(filename, lambda snapshot: snapshot.save_to_file(filename))
 
     def start_load(self):
-        """Loads a list from a file.
+        """Ask for a saved list and start loading it, asking again until the file exists.
 
         :return: null
         """
-        # Request filename.
+        # The last session may still be restoring, and it has to be on the list before anything is added to it.
+        self.wait_for_task()
+
         line_y, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 16)
-        self._list_display.addstr(line_y+4, 1, ' '*(self._list_width-2))
-        self._list_display.addstr(line_y+4, line_x, "Enter filename: ")
-        self._list_display.refresh()
+        self._list_display.timeout(-1)
+        while True:
+            # Request filename.
+            self._list_display.addstr(line_y+4, 1, ' '*(self._list_width-2))
+            self._list_display.addstr(line_y+4, line_x, "Enter filename: ")
+            self._list_display.refresh()
 
-        # Get filename
-        curses.echo()
-        filename = self._list_display.getstr().decode(encoding="utf-8")
-        filename = 'shopping_lists/data/' + filename
-        curses.noecho()
+            # Get filename
+            curses.echo()
+            filename = self._list_display.getstr().decode(encoding="utf-8")
+            filename = 'shopping_lists/data/' + filename
+            curses.noecho()
 
-        # Try to load list, and recursively call start_command if the file isn't loaded.
-        try:
-            new_list = Recipe.create_from_file(filename)
-            # Add ingredients to the shopping list.
-            new_list.add_to(self._shopping_list)
+            if pth.isfile(pth.join(pth.dirname(__file__), filename)):
+                break
 
-            # Alert user that list was updated..
-            line_y, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, len(filename)+13)
-            self._list_display.addstr(line_y+5, line_x, "{} fully loaded".format(filename))
-            self._list_display.refresh()
-        except (FileNotFoundError, IsADirectoryError):
-            # Alert user that file was not found.
-            line_y, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 13)
-            self._list_display.addstr(line_y+5, line_x, "File not found.")
-            self._list_display.refresh()
+            # Alert user that file was not found, then ask again.
+            error_y, error_x = util.center_start(self._list_height-2, self._list_width-2, 1, 15)
+            self._list_display.addstr(error_y+5, 1, ' '*(self._list_width-2))
+            self._list_display.addstr(error_y+5, error_x, "File not found.")
+        self._list_display.timeout(self.TICK)
+
+        def finish(new_list):
+            if isinstance(new_list, Exception):
+                self.show_status("Could not read {}".format(filename))
+            elif self._remote:
+                self.show_status("{} fully loaded".format(filename))
+            else:
+                # Add ingredients to the shopping list.
+                merged = self._shopping_list.merged
+                new_list.add_to(self._shopping_list)
+                self.show_loaded(filename, new_list.merged + self._shopping_list.merged - merged)
+
+        if self._remote:
+            self.run_in_background("Loading {}".format(filename), lambda: self._shopping_list.load(filename), finish)
+            return
 
-            # Retry getting a command
-            self.start_shopping_list()
+        # Lists can be very large, so they are streamed into a new recipe on the worker thread.
+        self.run_in_background("Loading {}".format(filename), lambda: Recipe.create_from_file(filename), finish)
 
     def show_intro(self):
         """Show welcome text."""
@@ -178,104 +583,227 @@ class MainScreen:
 
         self._list_display.refresh()
 
+    def start_indexing(self):
+        """Open the recipe catalog and bring it up to date on a thread of its own.
+
+        A cold catalog can take seconds to index, so it doesn't hold up the worker thread loads and saves run on.
+        The thread is a daemon, so quitting doesn't wait for it (an unfinished refresh is rolled back by SQLite).
+        :return: a reference to the main screen
+        """
+        def index():
+            try:
+                # Imported here, so starting the app doesn't wait for it.
+                from catalog import Catalog
+                # Index saved recipes, re-reading only the files that changed since last run.
+                catalog = Catalog()
+                catalog.refresh()
+                self._indexed = catalog
+            except Exception as error:
+                self._indexed = error
+
+        # Imported here, so starting the app doesn't wait for it.
+        from threading import Thread
+        Thread(target=index, name="Indexing recipes", daemon=True).start()
+        return self
+
+    def start_restore(self):
+        """Restore the last session on the worker thread and start indexing recipes, after the intro is shown.
+
+        The list, the recipes loaded and the page shown are restored; changes made meanwhile are kept on top.
+        :return: a reference to the main screen
+        """
+        self.start_indexing()
+        if self._remote:
+            # The server restores the shared list itself.
+            return self
+
+        journal = Journal(self._shopping_list, JOURNAL_FILE)
+
+        def restore():
+            session = {}
+            path = pth.join(pth.dirname(__file__), SESSION_FILE)
+            if pth.isfile(path):
+                with open(path, "r") as read_file:
+                    session = loads(read_file.read())
+            return journal.recover(), session
+
+        def finish(result):
+            self._restoring = False
+            if isinstance(result, Exception):
+                # Leave the journal alone, so the session isn't saved over what couldn't be read.
+                self.show_status("Could not restore last session")
+                return
+            recovered, session = result
+
+            # Keep whatever was added while the session was restoring.
+            added = self._shopping_list.copy()
+            self._shopping_list.restore(dict(recovered.items()))
+            self._journal = journal.attach()
+            if self._cleared_while_restoring:
+                # The list was cleared before the session came back, so clear what came back (in the journal too).
+                self._shopping_list.clear()
+            else:
+                self._loaded = session.get('loaded', []) + self._loaded
+                self._view.offset = session.get('offset', 0)
+            added.add_to(self._shopping_list)
+
+            # Restoring isn't a change the user can undo.
+            self._history.forget()
+            if recovered and not self._cleared_while_restoring:
+                self.show_status("Restored {} items from last session".format(len(recovered)))
+
+        self._restoring = self.run_in_background("Restoring last session", restore, finish)
+        return self
+
+    def save_session(self):
+        """Save the list as the journal's snapshot and the rest of the session next to it, for start_restore().
+
+        :return: a reference to the main screen
+        """
+        self._journal.checkpoint()
+        with util.atomic_write(pth.join(pth.dirname(__file__), SESSION_FILE)) as write_file:
+            write_file.write(dumps({'loaded': self._loaded, 'offset': self._view.offset}))
+        return self
+
     def start_shopping_list(self):
-        """Start the main screen by getting a command from a key.
+        """Start the main screen by getting a command from a key, asking again until the key is valid.
 
         Pressing 'q' will quit app.
         :return: a reference to the main screen
         """
-        key = self._list_display.getkey()
-        if key == '\n':
-            # Shopping list is already empty so program can continue
-            return self
-        elif key == 'l':
-            # Load a shopping list from saves.
-            self.start_load()
-            return self
-        elif key == 'q':
-            # quit app.
-            exit()
-        else:
-            # Use same method for centering text as show_intro(); add text below show_intro()'s.
-            line_y, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 28)
-            self._list_display.addstr(line_y+4, line_x, "Command not found, try again")
+        # Wait in ticks, so the last session is restored while the intro is shown.
+        self._list_display.timeout(self.TICK)
+        while True:
+            self.poll_task()
+            try:
+                key = self._list_display.getkey()
+            except curses.error:
+                # No key was pressed during this tick.
+                continue
+            if key == '\n':
+                # Shopping list is already empty so program can continue
+                return self
+            elif key == 'l':
+                # Load a shopping list from saves.
+                self.start_load()
+                return self
+            elif key == 'q':
+                # quit app.
+                self.quit()
+            else:
+                # Use same method for centering text as show_intro(); add text below show_intro()'s.
+                line_y, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 28)
+                self._list_display.addstr(line_y+4, line_x, "Command not found, try again")
 
-            self._list_display.refresh()
-            self.start_shopping_list()
+                self._list_display.refresh()
 
     def clear_screen(self):
         """Clear the contents of the screen.
 
         :return: a reference to the main screen
         """
-        self._list_display.clear()
+        self._list_display.erase()
 
         # Add back border and show display
         util.color_box(self._list_display, 0, 0, self._list_height-1, self._list_width-1, 3)
         self._list_display.refresh()
 
+        # Everything has to be drawn again on the next show_list().
+        self._view.invalidate()
+
         return self
 
     def show_list(self):
-        """Display the shopping list on screen."""
-        # Format the rows and columns the chart.
-        row = 2
-        column = 0
-
-        # Set up chart header.
-        _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 14)
-        self._list_display.addstr(1, line_x, "Shopping list:")
-
-        for ingredient in sorted(self._shopping_list):
-            # Format where to place each element in chart.
-            start_y = row
-            start_x = column*20+1
-
-            # Truncate ingredient if longer than 18 characters.
-            full_ingredient = self._shopping_list.show_ingredient(ingredient)
-            truncated_ingredient = full_ingredient[:18] + (full_ingredient[18:] and '..')
-
-            # Keep printing until list runs out of space.
-            try:
-                self._list_display.addstr(start_y, start_x, truncated_ingredient)
-            except curses.error:
-                # Window has run out of room, so stop printing.
-                break
-
-            row += 1
-
-            # Every column, restart row number.
-            if row == self._list_height-2:
-                column += 1
-                row = 2
-
-        self._list_display.refresh()
+        """Display the shopping list on screen, redrawing only the entries that changed."""
+        self._view.render()
+        if self._overlay is not None:
+            self.show_overlay()
+        curses.doupdate()
+
+    def show_overlay(self):
+        """Draw the latest performance stats into the overlay, on top of the list."""
+        height, width = self._overlay.getmaxyx()
+        self._overlay.erase()
+        util.color_box(self._overlay, 0, 0, height-1, width-1, 3)
+        self._overlay.addstr(0, 2, " Performance (press 'o' to close) ")
+        for i, line in enumerate(profiling.report_lines(width-2)[:height-2]):
+            self._overlay.addstr(i+1, 1, line[:width-2])
+        self._overlay.noutrefresh()
+
+    def pick(self, title, choices):
+        """Show a numbered list of choices over the list and wait for the user to pick one.
+
+        :param title: the line shown above the choices
+        :param choices: the lines to choose from (only the first MAX_CHOICES are shown)
+        :return: the position of the choice picked, or None if another key was pressed
+        """
+        choices = choices[:self.MAX_CHOICES]
+        height, width = len(choices)+5, self._list_width-8
+        begin_y, begin_x = self._list_display.getbegyx()
+        window = curses.newwin(height, width, begin_y+(self._list_height-height)//2, begin_x+4)
+        window.bkgd(' ', curses.color_pair(0))
+
+        window.addstr(1, 2, title[:width-4])
+        for i, choice in enumerate(choices):
+            line = "{}. {}".format(i+1, choice)
+            window.addstr(i+3, 2, line[:width-5] + (line[width-5:] and '..'))
+        footer = "Press 1-{} to load a recipe, any other key to close".format(len(choices))
+        window.addstr(height-1, 2, footer[:width-4])
+        window.refresh()
+        key = window.getkey()
+
+        # Picker covered part of the list, so show all of it again.
+        del window
+        self._list_display.touchwin()
+        if key.isdigit() and 1 <= int(key) <= len(choices):
+            return int(key)-1
+        return None
 
     def help(self):
-        """Show help window."""
+        """Show help window, then run the command of the key pressed (unless it is 'h')."""
         self.help_window.bkgd(' ', curses.color_pair(0))
 
         self.help_window.addstr(1, 19, "Help window")
-        self.help_window.addstr(3, 12, "To add an item, press 'a'")
-        self.help_window.addstr(4, 11, "To remove an item, press 'r'")
-        self.help_window.addstr(5, 11, "To load a recipe, press 'l'")
-        self.help_window.addstr(6, 10, "To save as a recipe, press 'w'")
-        self.help_window.addstr(7, 6, "To save as a shopping list, press 's'")
-        self.help_window.addstr(8, 12, "To clear the list, press 'c'")
-        self.help_window.addstr(9, 16, "To quit, press 'q'")
-        self.help_window.addstr(10, 3, "Otherwise, press 'h' to return to application")
+        for i, line in enumerate(self.HELP_LINES):
+            _, line_x = util.center_start(1, 50, 1, len(line))
+            self.help_window.addstr(i+3, line_x, line)
 
         self.help_window.refresh()
 
         # Close if user hits 'h', otherwise do the command user asks.
         key = self.help_window.getkey()
-        if key == 'h':
-            return
-        else:
+
+        # Help window covered part of the list, so show all of it again.
+        self._list_display.touchwin()
+        if key != 'h':
+            self.do_command(key)
+
+    def run(self):
+        """Show the list and handle keys until the user quits.
+
+        Keys are waited for in short ticks so background loads and saves can be finished between them.
+        """
+        self.clear_screen()
+        self._list_display.timeout(self.TICK)
+        while True:
+            self.poll_task()
+            if self._remote:
+                # Show changes made by other terminals sharing the list.
+                self._shopping_list.sync()
+            self.show_list()
+            try:
+                key = self._list_display.getkey()
+            except curses.error:
+                # No key was pressed during this tick.
+                continue
             self.do_command(key)
 
     def do_command(self, key=None):
-        """Execute a command based on key input."""
+        """Execute a command based on key input.
+
+        :param key: the key pressed (waits for a key if not given)
+        :return: null
+        """
         if key is None:
             key = self._list_display.getkey()
 
@@ -283,87 +811,242 @@ class MainScreen:
         self._list_display.addstr(self._list_height-2, 1, ' '*(self._list_width-2))
         self._list_display.refresh()
 
-        if key == 'l':
-            # Load a recipe.
-            try:
-                filename = self.request_element("Enter name of recipe to load: ")
-                self.add_recipe(filename)
-            except (FileNotFoundError, IsADirectoryError):
-                # Alert user that recipe wasn't loaded.
-                _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 18)
-                self._list_display.addstr(self._list_height-2, 1, ' '*(self._list_width-2))
-                self._list_display.addstr(self._list_height-2, line_x, "File not found")
-                self._list_display.refresh()
-                self.do_command()
-        elif key == 'a':
-            # Add an ingredient.
-            try:
-                # Pull data to add as a new ingredient.
-                item_name = self.request_element("Enter name of item: ")
-                item_quantity = int(self.request_element("Enter quantity of item: "))
-                item_qualifier = self.request_element("Enter qualifier of item: ")
-
-                self.add_item(item_name, item_quantity, item_qualifier)
-            except ValueError:
-                self._list_display.addstr(self._list_height-2, 1, ' '*(self._list_width-2))
-                _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 18)
-                self._list_display.addstr(self._list_height-2, line_x, "Could not add item")
-                self._list_display.refresh()
-                self.do_command()
-        elif key == 'q':
-            # Quit app.
-            exit()
-        elif key == 's':
-            # Save shopping list.
-            try:
-                filename = self.request_element("Enter name to save list as: ")
-                self.save_list(filename)
-            except IsADirectoryError:
-                # User didn't enter file, so tell the user and retry.
-                self._list_display.addstr(self._list_height-2, 1, ' '*(self._list_width-2))
+        # Whatever the command changes is undone together.
+        self._begin_step()
+        try:
+            self._commands.get(key, self.command_not_found)()
+        except ConnectionError:
+            if not self._remote:
+                raise
+            self.show_lost_connection()
+        finally:
+            self._end_step()
+
+    def _begin_step(self):
+        """Start grouping changes to the list into one undo step."""
+        if self._history is not None:
+            self._history.begin()
+
+    def _end_step(self):
+        """Finish the undo step started by _begin_step()."""
+        if self._history is not None:
+            self._history.end()
+
+    def command_not_found(self):
+        """Tell the user that the key was an invalid command."""
+        self.show_status("Command not found")
+
+    def command_load_recipe(self):
+        """Load a recipe."""
+        if self.is_busy():
+            return
+        filename = self.request_element("Enter name of recipe to load: ", self.recipe_index())
+        self.add_recipe(filename)
 
-                _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 23)
-                self._list_display.addstr(self._list_height-2, line_x, "File unable to be saved")
+    def command_load_recipe_times(self):
+        """Load a recipe several times over."""
+        if self.is_busy():
+            return
+        filename = self.request_element("Enter name of recipe to load: ", self.recipe_index())
+        try:
+            times = parse_quantity(self.request_element("Enter how many times to load it: "))
+        except ValueError:
+            self.show_status("Could not load recipe")
+            return
+        self.add_recipe(filename, times)
 
-                self._list_display.refresh()
-                self.do_command()
-        elif key == 'w':
-            # Save shopping list as a recipe.
-            try:
-                filename = self.request_element("Enter name to save recipe as: ")
-                self.save_as_recipe(filename)
-            except IsADirectoryError:
-                # User didn't enter file, so tell the user and retry.
-                self._list_display.addstr(self._list_height-2, 1, ' '*(self._list_width-2))
+    def command_add_item(self):
+        """Add an ingredient."""
+        try:
+            # Pull data to add as a new ingredient.
+            item_name = self.request_element("Enter name of item: ")
+            # Quantities may be fractions, as recipes write them ("1/2", "1 1/2" or "1½").
+            item_quantity = parse_quantity(self.request_element("Enter quantity of item: "))
+            item_qualifier = self.request_element("Enter qualifier of item: ")
+
+            self.add_item(item_name, item_quantity, item_qualifier)
+        except ValueError:
+            self.show_status("Could not add item")
+
+    def command_remove_item(self):
+        """Remove item."""
+        try:
+            item_name = self.request_element("Enter item to remove: ", self._item_index)
+            self.remove_item(item_name)
+        except ValueError:
+            # Item wasn't in list, so tell the user.
+            self.show_status("Item not found")
+
+    def command_save_list(self):
+        """Save shopping list."""
+        if self.is_busy():
+            return
+        filename = self.request_element("Enter name to save list as: ")
+        if filename:
+            self.save_list(filename)
+        else:
+            # User didn't enter file, so tell the user.
+            self.show_status("File unable to be saved")
 
-                _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 23)
-                self._list_display.addstr(self._list_height-2, line_x, "File unable to be saved")
+    def command_save_recipe(self):
+        """Save shopping list as a recipe."""
+        if self.is_busy():
+            return
+        filename = self.request_element("Enter name to save recipe as: ")
+        if filename:
+            self.save_as_recipe(filename)
+        else:
+            # User didn't enter file, so tell the user.
+            self.show_status("File unable to be saved")
+
+    def command_clear(self):
+        """Clear the shopping list."""
+        loaded = self._loaded
+        self._shopping_list.clear()
+        self._loaded = []
+        if self._restoring:
+            # Don't let the last session come back on top of the cleared list.
+            self._cleared_while_restoring = True
+        if self._history is not None and loaded:
+            # Undoing the clear brings back the recipes loaded along with their ingredients.
+            self._history.record(lambda: setattr(self, '_loaded', loaded), lambda: setattr(self, '_loaded', []))
+
+    def command_stock_pantry(self):
+        """Add an ingredient to the pantry."""
+        if self.is_busy():
+            return
+        try:
+            item_name = self.request_element("Enter name of item: ", self._item_index)
+            item_quantity = parse_quantity(self.request_element("Enter quantity of item: "))
+            item_qualifier = self.request_element("Enter qualifier of item: ")
+            self.pantry().add_ingredient(item_name, item_quantity, item_qualifier)
+        except ValueError:
+            self.show_status("Could not add item")
+            return
 
-                self._list_display.refresh()
-                self.do_command()
-        elif key == 'c':
-            # Clear the shopping list.
-            self._shopping_list.clear()
-        elif key == 'r':
-            # Remove item.
-            try:
-                item_name = self.request_element("Enter item to remove: ")
-                self.remove_item(item_name)
-            except ValueError:
-                # Item wasn't in list, so tell the user and retry.
-                self._list_display.addstr(self._list_height-2, 1, ' '*(self._list_width-2))
+        # Save a copy in the background, so the pantry can keep changing meanwhile.
+        snapshot = self.pantry().copy()
+        filename = self.pantry().filename
 
-                _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 15)
-                self._list_display.addstr(self._list_height-2, line_x, "Item not found")
+        def finish(result):
+            self.show_status("Could not save pantry" if isinstance(result, Exception) else
+                             "{} added to pantry".format(item_name))
 
-                self._list_display.refresh()
-                self.do_command()
-        elif key == 'h':
-            # Show help window
-            self.help()
+        self.run_in_background("Saving pantry", lambda: snapshot.save_to_file(filename, line_delimited=True),
+                               finish)
+
+    def command_subtract_pantry(self):
+        """Take what is already in the pantry off the shopping list."""
+        count = len(self._shopping_list)
+        try:
+            self._shopping_list.subtract(self.pantry())
+        except ValueError:
+            self.show_status("Could not take pantry off the list")
+            return
+        if self._remote:
+            self.show_status("Pantry taken off the list")
         else:
-            # Tell the user that the key was an invalid command.
-            _, line_x = util.center_start(self._list_height-2, self._list_width-2, 1, 18)
-            self._list_display.addstr(self._list_height-2, line_x, "Command not found")
-            self._list_display.refresh()
-            self.do_command()
+            self.show_status("Pantry took {} items off the list".format(count - len(self._shopping_list)))
+
+    def command_find(self):
+        """Find recipes containing an ingredient."""
+        item_name = self.request_element("Enter item to find: ", self.ingredient_index())
+        self.find_recipes(item_name)
+
+    def command_match(self):
+        """Find the saved recipes that can be made from the list and pantry, and load the one picked."""
+        # Matching indexes recipes itself, so it only waits for indexing that may still succeed.
+        if self._catalog is None and self._index_error is None:
+            self.show_index_pending()
+            return
+        if self.is_busy():
+            return
+        try:
+            answer = self.request_element("Allow how many missing items? (default 0): ")
+            max_missing = int(answer) if answer.strip() else 0
+        except ValueError:
+            self.show_status("Could not find recipes")
+            return
+        have = list(self._shopping_list) + list(self.pantry())
+        mtime = os.stat(pth.join(pth.dirname(__file__), 'saved_recipes')).st_mtime_ns
+
+        def show_matches(matcher):
+            if isinstance(matcher, Exception):
+                self.show_status("Could not index recipes: {}".format(matcher))
+                return
+            self._matcher, self._matcher_mtime = matcher, mtime
+            matches = matcher.match(have, max_missing, self.MAX_CHOICES)
+            if not matches:
+                self.show_status("No recipes can be made with at most {} missing".format(max_missing))
+                return
+            choice = self.pick("Recipes you can make, fewest missing first:", [
+                "{} (missing {})".format(recipe, ', '.join(missing)) if missing else recipe
+                for recipe, missing in matches])
+            if choice is not None:
+                self.add_recipe(matches[choice][0])
+
+        if self._matcher is not None and self._matcher_mtime == mtime:
+            show_matches(self._matcher)
+            return
+
+        def build():
+            # Imported here, so starting the app doesn't wait for it.
+            from catalog import Catalog
+            from matcher import RecipeMatcher
+            # A connection of its own, since the app's catalog may be used meanwhile.
+            catalog = Catalog()
+            try:
+                # Pick up recipes saved (or imported) since the catalog was indexed.
+                catalog.refresh()
+                return RecipeMatcher.from_catalog(catalog)
+            finally:
+                catalog.close()
+
+        self.run_in_background("Indexing recipes for matching", build, show_matches)
+
+    def command_next_page(self):
+        """Scroll to the next page of the list."""
+        self._view.next_page()
+
+    def command_previous_page(self):
+        """Scroll to the previous page of the list."""
+        self._view.previous_page()
+
+    def command_undo(self):
+        """Undo the last change to the list."""
+        if self._history is None:
+            self.show_status("A shared list can't be undone")
+        elif not self._history.undo():
+            self.show_status("Nothing to undo")
+
+    def command_redo(self):
+        """Redo the last change undone."""
+        if self._history is None:
+            self.show_status("A shared list can't be undone")
+        elif not self._history.redo():
+            self.show_status("Nothing to redo")
+
+    def command_overlay(self):
+        """Show or hide the performance overlay, turning profiling on the first time it is shown."""
+        if self._overlay is None:
+            profiling.enable()
+            begin_y, begin_x = self._list_display.getbegyx()
+            height, width = min(16, self._list_height-4), min(64, self._list_width-2)
+            self._overlay = curses.newwin(height, width, begin_y+1, begin_x+self._list_width-width-1)
+            self._overlay.bkgd(' ', curses.color_pair(1))
+        else:
+            self._overlay = None
+            # Overlay covered part of the list, so show all of it again.
+            self._list_display.touchwin()
+
+    def quit(self):
+        """Finish any save still running, then quit app."""
+        self.wait_for_task()
+        if self._worker is not None:
+            self._worker.shutdown()
+        if self._remote:
+            self._shopping_list.close()
+        elif self._journal is not None:
+            self.save_session()
+            self._journal.close()
+        exit()
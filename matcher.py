@@ -0,0 +1,168 @@
+__author__ = 'Kellan Childers'
+
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from time import perf_counter
+from names import normalize
+
+
+def set_bits(mask):
+    """Find the positions of the bits set in an int.
+
+    :param mask: a non-negative int
+    :return: an iterator of bit positions, lowest first
+    """
+    # Searching the binary text is done in C, unlike shifting a large int one bit at a time.
+    text = format(mask, 'b')[::-1]
+    position = text.find('1')
+    while position >= 0:
+        yield position
+        position = text.find('1', position+1)
+
+
+def count_bits(mask):
+    """Count the bits set in an int, on Pythons before 3.10 (which have no int.bit_count()).
+
+    :param mask: a non-negative int
+    :return: the number of bits set
+    """
+    return bin(mask).count('1')
+
+if hasattr(int, 'bit_count'):
+    count_bits = int.bit_count
+
+
+class RecipeMatcher:
+    """In-memory index of which recipes use which ingredients, for finding the recipes that can be made.
+
+    Each ingredient gets a bit: every recipe keeps the bits of its ingredients as one int, and every ingredient keeps
+    the bits of the recipes using it, so a query is a few whole-int operations per recipe instead of a file read.
+    """
+    def __init__(self):
+        """Create an empty index."""
+        self._recipes = []
+        # Bits of each recipe's ingredients, in the same order as _recipes.
+        self._recipe_bits = []
+
+        # Normalized ingredient -> its bit, the name it is shown as, and the bits of the recipes using it.
+        self._bits = {}
+        self._names = []
+        self._users = []
+
+        # Number of ingredients -> bits of the recipes with that many, to find recipes short enough to make
+        # with nothing on hand.
+        self._by_size = {}
+
+    def __len__(self):
+        return len(self._recipes)
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """Index every valid recipe in a catalog, without reading the recipe files.
+
+        :param catalog: an open Catalog
+        :return: a new RecipeMatcher
+        """
+        recipes = [(recipe, [name for _, name in rows]) for recipe, rows in
+                   groupby(catalog.ingredient_rows(), itemgetter(0))]
+
+        # Give the most used ingredients the lowest bits, so most recipes' ints stay small.
+        uses = Counter(normalize(name) for _, ingredients in recipes for name in ingredients)
+        matcher = cls()
+        for key, _ in uses.most_common():
+            matcher._bits[key] = len(matcher._names)
+            matcher._names.append(None)
+            matcher._users.append(0)
+        for recipe, ingredients in recipes:
+            matcher.add_recipe(recipe, ingredients)
+        return matcher
+
+    def add_recipe(self, recipe, ingredients):
+        """Add a recipe to the index.
+
+        :param recipe: the name of the recipe
+        :param ingredients: the names of its ingredients
+        :return: a reference to the matcher
+        """
+        index = len(self._recipes)
+        recipe_bit = 1 << index
+        bits = 0
+        for name in ingredients:
+            key = normalize(name)
+            bit = self._bits.get(key)
+            if bit is None:
+                bit = self._bits[key] = len(self._names)
+                self._names.append(None)
+                self._users.append(0)
+            if self._names[bit] is None:
+                # Show the ingredient as it is first written.
+                self._names[bit] = name
+            bits |= 1 << bit
+            self._users[bit] |= recipe_bit
+
+        self._recipes.append(recipe)
+        self._recipe_bits.append(bits)
+        size = count_bits(bits)
+        self._by_size[size] = self._by_size.get(size, 0) | recipe_bit
+        return self
+
+    def have_bits(self, names):
+        """Get the bits of the ingredients on hand.
+
+        :param names: the names of the ingredients on hand (a recipe, pantry or list of names), written any way
+        :return: an int with the bit of every indexed ingredient on hand set
+        """
+        # Set bits in a byte array and convert once, rather than building a large int for every name.
+        flags = bytearray((len(self._names) + 7) // 8)
+        for name in names:
+            bit = self._bits.get(normalize(name))
+            if bit is not None:
+                flags[bit >> 3] |= 1 << (bit & 7)
+        return int.from_bytes(flags, 'little')
+
+    def match(self, have, max_missing=0, limit=None):
+        """Find the recipes that can be made from the ingredients on hand, fewest missing first.
+
+        :param have: the names of the ingredients on hand (a recipe, pantry or list of names)
+        :param max_missing: the most ingredients a recipe may be missing
+        :param limit: the most recipes to return (optional, default: every match)
+        :return: a list of (recipe, names of the missing ingredients) pairs, ranked by the number missing and then by
+         the number on hand
+        """
+        have_bits = self.have_bits(have)
+
+        # Only recipes using something on hand, or short enough to be missing everything, can match.
+        candidates = 0
+        for bit in set_bits(have_bits):
+            candidates |= self._users[bit]
+        for size, recipes in self._by_size.items():
+            if size <= max_missing:
+                candidates |= recipes
+
+        ranked = []
+        for index in set_bits(candidates):
+            bits = self._recipe_bits[index]
+            missing_bits = bits & ~have_bits
+            missing = count_bits(missing_bits)
+            if missing <= max_missing:
+                ranked.append((missing, -count_bits(bits), self._recipes[index], missing_bits))
+        ranked.sort()
+        return [(recipe, [self._names[bit] for bit in set_bits(missing_bits)])
+                for _, _, recipe, missing_bits in ranked[:limit]]
+
+if __name__ == "__main__":
+    from catalog import Catalog
+    from pantry import Pantry
+    catalog = Catalog()
+    catalog.refresh()
+
+    start = perf_counter()
+    recipe_matcher = RecipeMatcher.from_catalog(catalog)
+    print("Indexed {} recipes in {:.3f}s".format(len(recipe_matcher), perf_counter() - start))
+
+    start = perf_counter()
+    matches = recipe_matcher.match(Pantry().load(), max_missing=2)
+    print("Found {} recipes makeable from the pantry in {:.4f}s:".format(len(matches), perf_counter() - start))
+    for recipe_name, missing_names in matches[:20]:
+        print("  {} (missing {})".format(recipe_name, ', '.join(missing_names) or 'nothing'))
@@ -0,0 +1,122 @@
+__author__ = 'Kellan Childers'
+
+import os.path as pth
+from json import load
+
+# Optional table of other names for ingredients, as {"name": "name it is merged into", ...}.
+SYNONYM_FILE = 'shopping_lists/synonyms.json'
+
+# Plurals that don't follow the usual rules.
+IRREGULAR_PLURALS = {
+    'leaves': 'leaf',
+    'loaves': 'loaf',
+    'halves': 'half',
+    'knives': 'knife',
+    'cookies': 'cookie',
+    'brownies': 'brownie',
+    'geese': 'goose',
+    'teeth': 'tooth',
+}
+
+# Words ending in s that aren't plurals.
+NOT_PLURALS = {'asparagus', 'couscous', 'hummus', 'molasses', 'citrus', 'swiss', 'series', 'species', 'grits'}
+
+
+def singular(word):
+    """Get the singular of a lower-case English word ('berries' is 'berry', 'tomatoes' is 'tomato').
+
+    :param word: the word, which may already be singular
+    :return: the singular word
+    """
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if len(word) <= 3 or word in NOT_PLURALS or not word.endswith('s') or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        # Short words drop only the s ('pies' is 'pie', 'ties' is 'tie'), longer ones end in y ('fries' is 'fry').
+        return word[:-1] if len(word) <= 4 else word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'xes', 'zes', 'oes')):
+        return word[:-2]
+    return word[:-1]
+
+
+class NameNormalizer:
+    """Turns the ways an ingredient is written into one key, so "Onion", "onions" and " onion " are merged.
+
+    Names are lower-cased, their spacing is collapsed, their last word is made singular, and then they are looked up
+    in the synonym table. Every name normalized is remembered, so each distinct spelling is only worked out once.
+    """
+    def __init__(self, synonyms=None, max_cached=1 << 17):
+        """Create a normalizer.
+
+        :param synonyms: a dict of name to the name it means (default: read from SYNONYM_FILE when first needed)
+        :param max_cached: the number of names remembered before the memo is emptied
+        :return: null
+        """
+        self.max_cached = max_cached
+        self._cache = {}
+        self._synonyms = None
+        if synonyms is not None:
+            self.set_synonyms(synonyms)
+
+    def set_synonyms(self, synonyms):
+        """Replace the synonym table.
+
+        :param synonyms: a dict of name to the name it means, written any way
+        :return: a reference to the normalizer
+        """
+        table = {self._base(name): self._base(meaning) for name, meaning in synonyms.items()}
+        # Follow chains (a means b, b means c) so looking a name up once is always enough.
+        for name in table:
+            seen = {name}
+            while table[name] in table and table[name] not in seen:
+                seen.add(table[name])
+                table[name] = table[table[name]]
+        self._synonyms = table
+        self._cache.clear()
+        return self
+
+    def load(self, filename=SYNONYM_FILE):
+        """Read the synonym table from a json file, or use none if it doesn't exist.
+
+        :param filename: the name of the file to read
+        :return: a reference to the normalizer
+        """
+        path = pth.join(pth.dirname(__file__), filename)
+        if not pth.isfile(path):
+            return self.set_synonyms({})
+        with open(path, "r") as read_file:
+            return self.set_synonyms(load(read_file))
+
+    @staticmethod
+    def _base(name):
+        """Normalize case, spacing and plurals, without synonyms."""
+        words = name.lower().split()
+        if words:
+            words[-1] = singular(words[-1])
+        return ' '.join(words)
+
+    def normalize(self, name):
+        """Get the key of an ingredient name.
+
+        :param name: the name as written
+        :return: the normalized name
+        """
+        key = self._cache.get(name)
+        if key is None:
+            if self._synonyms is None:
+                self.load()
+            base = self._base(name)
+            key = self._synonyms.get(base, base)
+            if len(self._cache) >= self.max_cached:
+                self._cache.clear()
+            self._cache[name] = key
+        return key
+
+# Normalizer shared by every recipe.
+normalizer = NameNormalizer()
+normalize = normalizer.normalize
+
+if __name__ == "__main__":
+    for example in ("Onion", "onions", " onion ", "Red  Onions", "berries", "pies", "Tomatoes", "asparagus", "peaches"):
+        print("{!r} -> {!r}".format(example, normalizer.normalize(example)))
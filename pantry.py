@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import os.path as pth
+from recipe import Recipe
+
+# Where the pantry is kept between runs (one record per line, so large pantries load quickly).
+PANTRY_FILE = 'shopping_lists/data/.pantry'
+
+
+class Pantry(Recipe):
+    """Ingredients already on hand, saved to a file between runs.
+
+    Take the pantry away from a shopping list with shopping_list.subtract(pantry).
+    """
+    __slots__ = ('filename',)
+
+    def __init__(self, filename=PANTRY_FILE):
+        """Create an empty pantry.
+
+        :param filename: the file the pantry is loaded from and saved to
+        :return: null
+        """
+        super().__init__()
+        self.filename = filename
+
+    def load(self):
+        """Load the pantry from its file, if it has been saved before.
+
+        :return: a reference to the pantry
+        """
+        if pth.isfile(pth.join(pth.dirname(__file__), self.filename)):
+            self.read_from_file(self.filename)
+        return self
+
+    def save(self):
+        """Save the pantry to its file.
+
+        :return: a reference to the pantry
+        """
+        return self.save_to_file(self.filename, line_delimited=True)
+
+    def stock(self, recipe):
+        """Put every ingredient of a recipe in the pantry (after shopping for a list, etc).
+
+        :param recipe: the recipe to add
+        :return: a reference to the pantry
+        """
+        recipe.add_to(self)
+        return self
+
+    def use(self, recipe):
+        """Take the ingredients of a recipe out of the pantry (after cooking it, etc).
+
+        :param recipe: the recipe to take out
+        :return: a reference to the pantry
+        """
+        return self.subtract(recipe)
+
+if __name__ == "__main__":
+    pantry = Pantry().load()
+    print("Pantry holds {} ingredients:".format(len(pantry)))
+    pantry.print_to_console()
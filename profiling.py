@@ -0,0 +1,142 @@
+__author__ = 'Kellan Childers'
+
+import importlib
+from functools import wraps
+from json import dump
+from time import perf_counter
+
+# Functions timed while profiling is on, as (module, attribute path).
+HOT_PATHS = [
+    ('recipe', 'Recipe.read_from_file'),
+    ('recipe', 'Recipe.merge_from_file'),
+    ('recipe', 'Recipe.save_to_file'),
+    ('recipe', 'Recipe.save_as_list'),
+    ('mainscreen', 'MainScreen.show_list'),
+    ('listview', 'ListView.frame'),
+    ('util', 'color_box'),
+]
+
+# True while hot paths are wrapped; code with its own counters checks this before counting.
+enabled = False
+
+# Name -> [calls, total seconds, max seconds, histogram], where histogram[i] counts calls taking under 2**i us.
+_timings = {}
+_counters = {}
+# (owner, attribute) -> original function, for everything wrapped by enable().
+_originals = {}
+
+
+def _resolve(module_name, path):
+    """Find the object holding a hot path and the name of the function on it."""
+    owner = importlib.import_module(module_name)
+    *parents, attribute = path.split('.')
+    for parent in parents:
+        owner = getattr(owner, parent)
+    return owner, attribute
+
+
+def record(name, seconds):
+    """Add one call's duration to the statistics for name."""
+    timing = _timings.get(name)
+    if timing is None:
+        timing = _timings[name] = [0, 0.0, 0.0, [0]*32]
+    timing[0] += 1
+    timing[1] += seconds
+    timing[2] = max(timing[2], seconds)
+    timing[3][min(31, int(seconds*1e6).bit_length())] += 1
+
+
+def count(name, amount=1):
+    """Add to a counter (callers should check enabled first, so this costs nothing when profiling is off)."""
+    _counters[name] = _counters.get(name, 0) + amount
+
+
+def _timed(name, function):
+    """Wrap a function so every call's duration is recorded."""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, perf_counter() - start)
+    return wrapper
+
+
+def enable():
+    """Start timing every hot path.
+
+    Functions are swapped for timed wrappers, so nothing is added to their calls while profiling is off.
+    """
+    global enabled
+    if enabled:
+        return
+    for module_name, path in HOT_PATHS:
+        owner, attribute = _resolve(module_name, path)
+        original = getattr(owner, attribute)
+        _originals[(owner, attribute)] = original
+        setattr(owner, attribute, _timed(path, original))
+    enabled = True
+
+
+def disable():
+    """Stop timing, putting the original functions back (statistics are kept)."""
+    global enabled
+    for (owner, attribute), original in _originals.items():
+        setattr(owner, attribute, original)
+    _originals.clear()
+    enabled = False
+
+
+def reset():
+    """Forget every statistic recorded so far."""
+    _timings.clear()
+    _counters.clear()
+
+
+def percentile(histogram, fraction):
+    """Estimate a percentile from a histogram, as the upper bound of its bucket in seconds."""
+    target = fraction * sum(histogram)
+    running = 0
+    for i, calls in enumerate(histogram):
+        running += calls
+        if running >= target and calls:
+            return (2**i) / 1e6
+    return 0.0
+
+
+def stats():
+    """Get every statistic recorded so far.
+
+    :return: a dict with 'timings' (name to calls, total, mean, p50, p99, max and histogram) and 'counters'
+    """
+    timings = {}
+    for name, (calls, total, longest, histogram) in _timings.items():
+        timings[name] = {'calls': calls, 'total': total, 'mean': total/calls,
+                         'p50': percentile(histogram, 0.5), 'p99': percentile(histogram, 0.99),
+                         'max': longest, 'histogram': list(histogram)}
+    return {'timings': timings, 'counters': dict(_counters)}
+
+
+def report_lines(width):
+    """Summarize the statistics as lines of text for the overlay.
+
+    :param width: the number of characters each line may use
+    :return: a list of lines, slowest total time first
+    """
+    lines = ["{:<{w}} {:>6} {:>8} {:>8}".format('function', 'calls', 'mean ms', 'p99 ms', w=width-26)]
+    for name, timing in sorted(stats()['timings'].items(), key=lambda item: -item[1]['total']):
+        lines.append("{:<{w}} {:>6} {:>8.3f} {:>8.3f}".format(
+            name[-(width-26):], timing['calls'], timing['mean']*1e3, timing['p99']*1e3, w=width-26))
+    for name, amount in sorted(_counters.items()):
+        lines.append("{:<{w}} {:>6}".format(name[-(width-26):], amount, w=width-26))
+    return lines
+
+
+def dump_stats(filename):
+    """Save every statistic to a json file.
+
+    :param filename: the path of the file to write
+    """
+    with open(filename, "w") as write_file:
+        dump(stats(), write_file, indent=1)
@@ -2,14 +2,131 @@
 __author__ = 'Kellan Childers'
 
 import os.path as pth
-from json import dump, load
+import units
+import util
+from export import export
+from json import dump, dumps, load, loads
+from names import normalize
+
+try:
+    import numpy
+except ImportError:
+    # Weighted merges are totalled in plain Python instead.
+    numpy = None
+
+# Lists saved with this extension hold one [name, quantity, qualifier] record per line.
+LINE_DELIMITED_EXTENSION = '.ndjson'
+
+# First bytes of a file in the memory-mapped binary format (see binformat.py).
+BINARY_MAGIC = b'RCPB'
+
+# Ingredients with this qualifier are other saved recipes (named by filename, next to the recipe using them), their
+# quantity being how many times over to add them. RecipeCache expands them.
+RECIPE_QUALIFIER = 'recipe'
+
+
+def is_binary(filename):
+    """Check whether a file is in the binary format.
+
+    :param filename: the name of the file to check
+    :return: True if the file starts with BINARY_MAGIC
+    """
+    with open(pth.join(pth.dirname(__file__), filename), "rb") as read_file:
+        return read_file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def is_line_delimited(read_file):
+    """Check whether an open file holds one record per line instead of a single json dict.
+
+    The file is returned to its start afterwards.
+    :param read_file: a file opened for reading text
+    :return: True if the file is line-delimited
+    """
+    first = read_file.read(1)
+    while first.isspace():
+        first = read_file.read(1)
+    read_file.seek(0)
+    return first == '['
+
+
+def iter_records(filename):
+    """Read the ingredients in a file one at a time, in any format.
+
+    Line-delimited and binary files are never held in memory all at once.
+    :param filename: the name of the file to be read
+    :return: an iterator of (name, quantity, qualifier) tuples
+    :raise ValueError: if a record is not a name, quantity and qualifier
+    """
+    if is_binary(filename):
+        # Imported here, since binformat itself builds on recipes.
+        from binformat import MappedRecipe
+        mapped = MappedRecipe(filename)
+        try:
+            for name, (quantity, qualifier) in mapped.items():
+                yield name, quantity, qualifier
+        finally:
+            mapped.close()
+        return
+
+    with open(pth.join(pth.dirname(__file__), filename), "r") as read_file:
+        if is_line_delimited(read_file):
+            for line in read_file:
+                if line.strip():
+                    name, quantity, qualifier = loads(line)
+                    yield name, quantity, qualifier
+        else:
+            for name, full_quantity in load(read_file).items():
+                if not isinstance(full_quantity, list) or len(full_quantity) != 2:
+                    raise ValueError("Ingredient {!r} is not a [quantity, qualifier] pair.".format(name))
+                yield name, full_quantity[0], full_quantity[1]
+
+
+def weighted_totals(weighted_recipes):
+    """Total the ingredients of several recipes, each multiplied by a weight, in one pass.
+
+    Quantities are summed with numpy when it is installed.
+    :param weighted_recipes: an iterable of (recipe, weight) pairs
+    :return: a dict of (name, qualifier) to total quantity
+    """
+    totals = {}
+    if numpy is None:
+        for recipe, weight in weighted_recipes:
+            for name, (quantity, qualifier) in recipe.items():
+                key = (name, qualifier)
+                totals[key] = totals.get(key, 0) + quantity*weight
+        return totals
+
+    # Give each (name, qualifier) a row, then sum every weighted quantity into its row at once.
+    rows, quantities, weights, counts = [], [], [], []
+    for recipe, weight in weighted_recipes:
+        start = len(rows)
+        for name, (quantity, qualifier) in recipe.items():
+            rows.append(totals.setdefault((name, qualifier), len(totals)))
+            quantities.append(quantity)
+        weights.append(weight)
+        counts.append(len(rows) - start)
+    sums = numpy.bincount(numpy.array(rows, dtype=numpy.intp),
+                          weights=numpy.array(quantities, dtype=float)*numpy.repeat(weights, counts),
+                          minlength=len(totals)).tolist()
+    return {key: int(total) if total.is_integer() else total for key, total in zip(totals, sums)}
 
 
 class Recipe:
-    """Base class for making and containing recipes of ingredients."""
+    """Base class for making and containing recipes of ingredients.
+
+    Ingredients are kept under the name they were first added with, and found by any spelling that normalizes to
+    the same key (see names.py), so "Onion", "onions" and " onion " are one ingredient.
+    """
+    __slots__ = ('_ingredients', '_listeners', '_aliases', 'merged')
+
     def __init__(self):
         """Initialize a blank recipe."""
         self._ingredients = {}
+        self._listeners = []
+        # Normalized key -> stored name, for every stored name that isn't its own key.
+        self._aliases = {}
+        # How many times an ingredient was added under another spelling and merged into the stored one.
+        self.merged = 0
 
     @staticmethod
     def create_from_file(filename):
@@ -24,6 +141,90 @@ class Recipe:
     def __iter__(self):
         return iter(self._ingredients)
 
+    def __len__(self):
+        return len(self._ingredients)
+
+    def __contains__(self, name):
+        return name in self._ingredients or self._stored_name(name) is not None
+
+    def _lookup(self, name):
+        """Find the name an ingredient is stored under, however it is written.
+
+        :param name: the name of the ingredient
+        :return: a tuple of the stored name (None if the ingredient isn't in the recipe) and the normalized key of
+         name (None if name is stored as written)
+        """
+        if name in self._ingredients:
+            return name, None
+        key = normalize(name)
+        return key if key in self._ingredients else self._aliases.get(key), key
+
+    def _stored_name(self, name):
+        """Find the name an ingredient is stored under, or None if it isn't in the recipe (see _lookup())."""
+        return self._lookup(name)[0]
+
+    def _new_name(self, name, key):
+        """Get the name to store a new ingredient under (as written, without surrounding spaces), indexing its key."""
+        name = name.strip()
+        if key != name:
+            self._aliases[key] = name
+        return name
+
+    def _forget_name(self, name):
+        """Stop finding a removed ingredient by its other spellings."""
+        key = normalize(name)
+        if self._aliases.get(key) == name:
+            del self._aliases[key]
+
+    @staticmethod
+    def _combine(name, current, quantity, qualifier):
+        """Add a quantity to an ingredient's (quantity, qualifier), keeping its qualifier.
+
+        :return: the new (quantity, qualifier)
+        :raise ValueError: if the quantity can't be converted to the qualifier
+        """
+        if current[1] == qualifier:
+            return current[0] + quantity, qualifier
+        # Convert to the qualifier already in the recipe (grams of flour into cups of flour, etc).
+        factor = units.registry.factor(qualifier, current[1], name)
+        if factor is None:
+            raise ValueError("Attempting to add two different quantities failed.")
+        return current[0] + quantity*factor, current[1]
+
+    def items(self):
+        """Get every ingredient with its quantity.
+
+        :return: an iterable of (name, (quantity, qualifier)) pairs
+        """
+        return self._ingredients.items()
+
+    def add_listener(self, listener):
+        """Call a function whenever the recipe changes.
+
+        Listeners are called as listener(action, name, old, new), where action is one of:
+        'set' (name's (quantity, qualifier) went from old, or None if new, to new),
+        'remove' (name was removed; old was its (quantity, qualifier)),
+        'replace' (every ingredient was replaced; old and new are dicts of name to (quantity, qualifier)).
+        :param listener: the function to call
+        :return: a reference to the recipe
+        """
+        self._listeners.append(listener)
+        return self
+
+    def remove_listener(self, listener):
+        """Stop calling a function added with add_listener.
+
+        :param listener: the function to stop calling
+        :return: a reference to the recipe
+        """
+        self._listeners.remove(listener)
+        return self
+
+    def _notify(self, action, name, old, new):
+        """Tell every listener about a change."""
+        for listener in self._listeners:
+            listener(action, name, old, new)
+
     def add_ingredient(self, name, quantity, qualifier):
         """Add ingredient to the recipe, or update quantity of ingredient.
 
@@ -31,21 +232,45 @@ class Recipe:
         :param quantity: the quantity of the ingredient
         :param qualifier: the type of quantity of the ingredient (ounces, pounds, etx)
         :return: a reference to the recipe
+        :raise ValueError: if the quantity can't be converted to the qualifier already in the recipe
         """
-        try:
-            current = self._ingredients[name]
-            if current[1] == qualifier:
-                new_quantity = current[0] + quantity
-                self._ingredients[name] = (new_quantity, qualifier)
-            else:
-                raise ValueError("Attempting to add two different quantities failed.")
-            return self
-        except KeyError:
-            # If there isn't already an ingredient with this name, add it.
-            self._ingredients[name] = (quantity, qualifier)
-            return self
-        except ValueError as e:
-            raise e
+        ingredients = self._ingredients
+        current = ingredients.get(name)
+        if current is None:
+            # Look for the ingredient under another spelling (as _lookup() does, inlined as this runs per item).
+            key = normalize(name)
+            stored = key if key in ingredients else self._aliases.get(key)
+            if stored is None:
+                # If there isn't already an ingredient with this name, add it.
+                name = self._new_name(name, key)
+                new = ingredients[name] = (quantity, qualifier)
+                if self._listeners:
+                    self._notify('set', name, None, new)
+                return self
+            self.merged += 1
+            name, current = stored, ingredients[stored]
+
+        new = ingredients[name] = self._combine(name, current, quantity, qualifier)
+
+        if self._listeners:
+            self._notify('set', name, current, new)
+        return self
+
+    def set_ingredient(self, name, quantity, qualifier):
+        """Set the quantity of an ingredient, replacing any quantity already in the recipe.
+
+        :param name: the name of the ingredient
+        :param quantity: the quantity of the ingredient
+        :param qualifier: the type of quantity of the ingredient (ounces, pounds, etx)
+        :return: a reference to the recipe
+        """
+        stored, key = self._lookup(name)
+        name = self._new_name(name, key) if stored is None else stored
+        current = self._ingredients.get(name)
+        new = self._ingredients[name] = (quantity, qualifier)
+        if self._listeners:
+            self._notify('set', name, current, new)
+        return self
 
     def remove_ingredient(self, name):
         """Remove ingredient from recipe.
@@ -54,7 +279,11 @@ class Recipe:
         :return: a copy of the removed ingredient
         """
         item = (name, self.get_ingredient_quantity(name))
+        name = self._stored_name(name)
         del self._ingredients[name]
+        self._forget_name(name)
+        if self._listeners:
+            self._notify('remove', name, item[1], None)
         return item
 
     def get_ingredient_quantity(self, name):
@@ -66,33 +295,64 @@ class Recipe:
         try:
             return self._ingredients[name]
         except KeyError:
-            raise ValueError("No ingredient by that name.")
+            stored = self._stored_name(name)
+            if stored is None:
+                raise ValueError("No ingredient by that name.")
+            return self._ingredients[stored]
 
     def show_ingredient(self, name):
         """Get an ingredient and show it as a string."""
-        quantity, qualifier = self.get_ingredient_quantity(name)
-        ingredient = (str(quantity) + ' ' + qualifier + ' ' + name) if qualifier != '' \
-            else (str(quantity) + ' ' + name)
+        quantity, qualifier = units.registry.readable(*self.get_ingredient_quantity(name))
+        quantity = units.format_quantity(quantity)
+        ingredient = (quantity + ' ' + qualifier + ' ' + name) if qualifier != '' \
+            else (quantity + ' ' + name)
         return ingredient
 
     def read_from_file(self, filename):
         """Read a file and load the recipe from it.
 
+        The file may be a json dict, line-delimited records or binary; the format is detected automatically.
         :param filename: the name of the file to be read
         :return: a reference to the recipe
         """
-        with open(pth.join(pth.dirname(__file__), filename), "r") as read_file:
-            self._ingredients = load(read_file)
+        if not is_binary(filename):
+            with open(pth.join(pth.dirname(__file__), filename), "r") as read_file:
+                if not is_line_delimited(read_file):
+                    return self.restore(load(read_file))
+        self.clear()
+        return self.merge_from_file(filename)
+
+    def merge_from_file(self, filename):
+        """Add every ingredient in a file to the recipe as it is read.
+
+        :param filename: the name of the file to be read (json dict or line-delimited)
+        :return: a reference to the recipe
+        """
+        for name, quantity, qualifier in iter_records(filename):
+            self.add_ingredient(name, quantity, qualifier)
         return self
 
-    def save_to_file(self, filename):
+    def _data(self):
+        """Get the recipe as a dict of name to (quantity, qualifier), as saved in json files."""
+        return self._ingredients
+
+    def save_to_file(self, filename, line_delimited=None):
         """Save a recipe to a json file.
 
+        The file is only replaced once it has been fully written.
         :param filename: the name of the file to be written to (will lose all old data)
+        :param line_delimited: whether to write one record per line (default: only if filename ends in .ndjson)
         :return: a reference to the recipe
         """
-        with open(pth.join(pth.dirname(__file__), filename), "w") as write_file:
-            dump(self._ingredients, write_file)
+        if line_delimited is None:
+            line_delimited = filename.endswith(LINE_DELIMITED_EXTENSION)
+
+        with util.atomic_write(pth.join(pth.dirname(__file__), filename)) as write_file:
+            if line_delimited:
+                for name, (quantity, qualifier) in self.items():
+                    write_file.write(dumps([name, quantity, qualifier]) + '\n')
+            else:
+                dump(self._data(), write_file)
         return self
 
     def print_to_console(self):
@@ -100,29 +360,143 @@ class Recipe:
         for ingredient in self._ingredients:
             print(self.show_ingredient(ingredient))
 
-    def save_as_list(self, filename, add_to=False):
+    def save_as_list(self, filename, add_to=False, aisles=None):
         """Save the recipe as a human-readable list of ingredients.
 
+        Rewritten lists only replace the old list once fully written (see export.export for other formats).
         :param add_to: a boolean value determining if the file should be appended to (true)
          or rewritten (false, default)
+        :param aisles: an export.AisleMap to group the list by (optional, default: ingredients in recipe order)
+        :return: a reference to the recipe
+        """
+        return export(self, [(filename, 'text')], aisles, append=add_to)
+
+    def restore(self, ingredients):
+        """Replace every ingredient in the recipe at once.
+
+        Names are stored as add_ingredient() stores them, and names written differently that normalize to the same
+        key are merged.
+        :param ingredients: a dict of name to (quantity, qualifier), which the recipe takes ownership of
         :return: a reference to the recipe
         """
-        if add_to:
-            with open(pth.join(pth.dirname(__file__), filename), "a") as write_file:
-                for ingredient in self._ingredients:
-                    write_file.write(self.show_ingredient(ingredient) + '\n')
+        keys = {}
+        for name in ingredients:
+            if keys.setdefault(normalize(name), name) is not name:
+                # Some names are the same ingredient, so add them up one at a time instead.
+                ingredients, aliases = self._collapse(ingredients)
+                break
         else:
-            with open(pth.join(pth.dirname(__file__), filename), "w") as write_file:
-                for ingredient in self._ingredients:
-                    write_file.write(self.show_ingredient(ingredient) + '\n')
+            if any(name != name.strip() for name in ingredients):
+                ingredients = {name.strip(): full_quantity for name, full_quantity in ingredients.items()}
+            aliases = {key: name for key, name in zip(keys, ingredients) if key != name}
+
+        return self._replace(ingredients, aliases)
+
+    def _replace(self, ingredients, aliases):
+        """Replace every ingredient at once with ingredients whose aliases are already known, and tell listeners."""
+        old, self._ingredients, self._aliases = self._ingredients, ingredients, aliases
+        if self._listeners:
+            self._notify('replace', None, old, ingredients)
         return self
 
+    def _collapse(self, ingredients):
+        """Merge the names of a dict of ingredients that are the same ingredient.
+
+        Quantities that can't be converted to each other's qualifier are kept apart, under their own names.
+        :param ingredients: a dict of name to (quantity, qualifier)
+        :return: the merged dict of ingredients and its aliases
+        """
+        collapsed = Recipe()
+        for name, (quantity, qualifier) in ingredients.items():
+            try:
+                collapsed.add_ingredient(name, quantity, qualifier)
+            except ValueError:
+                # Without surrounding spaces, unless that is the name of the ingredient it couldn't be added to.
+                name = name.strip() if name.strip() not in collapsed._ingredients else name
+                if name in collapsed._ingredients:
+                    raise
+                collapsed._ingredients[name] = (quantity, qualifier)
+        self.merged += collapsed.merged
+        return collapsed._ingredients, collapsed._aliases
+
     def clear(self):
         """Remove all ingredients from the recipe.
 
         :return: a reference to the recipe
         """
-        self._ingredients = {}
+        return self.restore({})
+
+    def scale(self, factor):
+        """Multiply the quantity of every ingredient, as when changing the number of servings.
+
+        :param factor: the number to multiply by
+        :return: a reference to the recipe
+        """
+        # Names are unchanged, so they don't need normalizing again.
+        return self._replace({name: (quantity*factor, qualifier) for name, (quantity, qualifier) in self.items()},
+                             self._aliases)
+
+    def add_weighted(self, weighted_recipes):
+        """Add several recipes to the recipe, each multiplied by a weight.
+
+        Ingredients are totalled across every recipe first, so each one is only added to the recipe once.
+        :param weighted_recipes: an iterable of (recipe, weight) pairs
+        :return: a reference to the recipe
+        :raise ValueError: if a total can't be converted to the qualifier already in the recipe
+        """
+        for (name, qualifier), total in weighted_totals(weighted_recipes).items():
+            self.add_ingredient(name, total, qualifier)
+        return self
+
+    def subtract(self, other):
+        """Take away the ingredients of another recipe (what is already in the pantry, etc).
+
+        Only names in both recipes are looked at. Quantities are converted to this recipe's units first; those
+        that can't be converted are left alone. Ingredients used up entirely are removed, never left negative.
+        :param other: the recipe to take away
+        :return: a reference to the recipe
+        """
+        # Work out every change before making any, from the ingredients the recipes share (looking up the smaller
+        # recipe's names in the larger one, however each spells them).
+        if isinstance(other, Recipe) and len(self) <= len(other):
+            shared = ((name, other._stored_name(name)) for name in self._ingredients)
+            taking = ((name, other.get_ingredient_quantity(other_name)) for name, other_name in shared
+                      if other_name is not None)
+        else:
+            taking = ((self._stored_name(name), full_quantity) for name, full_quantity in other.items())
+
+        # Several of the other recipe's names may be one of this recipe's ingredients, so total them first.
+        taken = {}
+        for name, (have, have_qualifier) in taking:
+            if name is None:
+                continue
+            qualifier = self.get_ingredient_quantity(name)[1]
+            factor = 1 if have_qualifier == qualifier else units.registry.factor(have_qualifier, qualifier, name)
+            if factor is not None:
+                taken[name] = taken.get(name, 0) + have*factor
+
+        changes = {}
+        for name, have in taken.items():
+            quantity, qualifier = self.get_ingredient_quantity(name)
+            remaining = quantity - have
+            # Allow for float error, so converted quantities that should cancel out do.
+            changes[name] = (remaining, qualifier) if remaining > 1e-9*abs(quantity) else None
+
+        if len(changes)*8 < len(self):
+            # Few changes: tell listeners about each one.
+            for name, new in changes.items():
+                if new is None:
+                    self.remove_ingredient(name)
+                else:
+                    self.set_ingredient(name, new[0], new[1])
+        elif changes:
+            # Most of the recipe changed: replace it in one go rather than telling listeners about every item.
+            kept = {}
+            for name, full_quantity in self.items():
+                new = changes.get(name, full_quantity)
+                if new is not None:
+                    kept[name] = new
+            self._replace(kept, {key: name for key, name in self._aliases.items() if name in kept})
         return self
 
     def copy(self):
@@ -130,9 +504,11 @@ class Recipe:
 
         :return: an identical copy of the recipe
         """
+        # Quantities are never changed in place, so copying the dict is enough.
         new_recipe = Recipe()
-        for ingredient, full_quantity in self._ingredients.items():
-            new_recipe.add_ingredient(ingredient, full_quantity[0], full_quantity[1])
+        new_recipe._ingredients = self._ingredients.copy()
+        new_recipe._aliases = self._aliases.copy()
+        new_recipe.merged = self.merged
         return new_recipe
 
     def add_to(self, receiving_recipe):
@@ -155,6 +531,9 @@ if __name__ == "__main__":
     print("Adding shallots.")
     recipe.add_ingredient("shallots", 5, "chopped")
     print("There are {0} and {1}.\n".format(recipe.show_ingredient("onions"), recipe.show_ingredient("shallots")))
+    print("Doubling the recipe.")
+    recipe.scale(2)
+    print("There are {0} and {1}.\n".format(recipe.show_ingredient("onions"), recipe.show_ingredient("shallots")))
     print("Copying recipe and clearing original\n")
     recipe1 = recipe.copy()
     recipe.clear()
@@ -0,0 +1,126 @@
+__author__ = 'Kellan Childers'
+
+from bisect import bisect_left, insort
+from heapq import nsmallest
+from itertools import islice
+
+
+def trigrams(text):
+    """Get the set of three-letter pieces of a lowercase string, padded so short strings still have some."""
+    padded = '  ' + text + ' '
+    return {padded[i:i+3] for i in range(len(padded)-2)}
+
+
+class CompletionIndex:
+    """Index of names for ranked completion of partly typed text.
+
+    Prefix matches are found by bisecting a sorted list; anything else is matched on shared trigrams.
+    """
+    # The most candidates scored for a fuzzy match, taken from the rarest trigrams of the query.
+    MAX_CANDIDATES = 300
+
+    def __init__(self, names=()):
+        """Create an index of some names.
+
+        :param names: the names to index
+        :return: null
+        """
+        self.rebuild(names)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def rebuild(self, names):
+        """Replace every name in the index.
+
+        :param names: the names to index
+        :return: a reference to the index
+        """
+        # Every name; (lowercase name, name) pairs in sorted order; trigram -> set of names containing it.
+        self._names = set(names)
+        self._keys = sorted((name.lower(), name) for name in self._names)
+        self._grams = {}
+        for name in self._names:
+            for gram in trigrams(name.lower()):
+                self._grams.setdefault(gram, set()).add(name)
+        return self
+
+    def add(self, name):
+        """Add a name to the index.
+
+        :param name: the name to add
+        :return: a reference to the index
+        """
+        if name not in self._names:
+            self._names.add(name)
+            insort(self._keys, (name.lower(), name))
+            for gram in trigrams(name.lower()):
+                self._grams.setdefault(gram, set()).add(name)
+        return self
+
+    def remove(self, name):
+        """Remove a name from the index (if it is there).
+
+        :param name: the name to remove
+        :return: a reference to the index
+        """
+        if name in self._names:
+            self._names.discard(name)
+            del self._keys[bisect_left(self._keys, (name.lower(), name))]
+            for gram in trigrams(name.lower()):
+                postings = self._grams[gram]
+                postings.discard(name)
+                if not postings:
+                    del self._grams[gram]
+        return self
+
+    def on_change(self, action, name, old, new):
+        """Follow the ingredients of a recipe (see Recipe.add_listener)."""
+        if action == 'set':
+            if old is None:
+                self.add(name)
+        elif action == 'remove':
+            self.remove(name)
+        else:
+            self.rebuild(new)
+
+    def complete(self, text, limit=5):
+        """Find the names that best match partly typed text.
+
+        Names starting with the text come first (shortest first), then names sharing the most trigrams with it.
+        :param text: what has been typed so far
+        :param limit: the most names to return
+        :return: a list of names, best match first
+        """
+        key = text.lower()
+        if not key:
+            return []
+
+        # Names starting with the text sit together in the sorted keys.
+        start = bisect_left(self._keys, (key, ''))
+        prefixed = []
+        for lowered, name in self._keys[start:start+limit*4]:
+            if not lowered.startswith(key):
+                break
+            prefixed.append(name)
+        results = nsmallest(limit, prefixed, key=lambda name: (len(name), name))
+        if len(results) >= limit:
+            return results
+
+        # Score candidates from the rarest trigrams of the text, so common trigrams don't cost a full scan.
+        query = trigrams(key)
+        postings = sorted((self._grams[gram] for gram in query if gram in self._grams), key=len)
+        candidates = set()
+        for posting in postings:
+            if len(candidates) >= self.MAX_CANDIDATES:
+                break
+            candidates.update(islice(posting, self.MAX_CANDIDATES - len(candidates)))
+        candidates.difference_update(results)
+
+        # Count shared trigrams by membership in the postings already looked up, rather than splitting every name.
+        scored = nsmallest(limit - len(results), candidates, key=lambda name: (
+            key not in name.lower(), -sum(name in posting for posting in postings), len(name), name))
+        return results + scored
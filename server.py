@@ -0,0 +1,395 @@
+#!/usr/bin/python3
+__author__ = 'Kellan Childers'
+
+import argparse
+import os
+import os.path as pth
+import socket
+import socketserver
+from json import dumps, loads
+from queue import Empty, Queue
+from threading import Lock, Thread
+from export import save_list
+from cache import RecipeCache
+from journal import Journal, encode_change
+from recipe import Recipe
+
+# Where the server listens unless told otherwise (relative to the app).
+SOCKET = 'shopping_lists/data/.server.sock'
+
+# Directories clients may load files from.
+LOAD_DIRECTORIES = ('saved_recipes', 'shopping_lists/data')
+
+# Errors passed back to clients as themselves; anything else is raised as a RuntimeError.
+ERRORS = {error.__name__: error for error in
+          (ValueError, FileNotFoundError, IsADirectoryError, PermissionError, ConnectionError)}
+
+
+def socket_path(address):
+    """Get the full path of a socket given relative to the app."""
+    return pth.join(pth.dirname(__file__), address)
+
+
+def _inside(directory, filename):
+    """Get the path of a file in one of the app's directories.
+
+    :param directory: the directory (relative to the app) the file must be in
+    :param filename: the name of the file
+    :return: the full path of the file
+    :raise PermissionError: if the name leads outside the directory
+    """
+    root = pth.realpath(pth.join(pth.dirname(__file__), directory))
+    path = pth.realpath(pth.join(root, filename))
+    if pth.commonpath([root, path]) != root or path == root:
+        raise PermissionError("{} is not in {}".format(filename, directory))
+    return path
+
+
+class ClientHandler(socketserver.StreamRequestHandler):
+    """Serves one connected client: requests are read here, replies and list changes are sent by a writer thread."""
+    def handle(self):
+        outbox = Queue()
+        writer = Thread(target=self._write, args=(outbox,), daemon=True)
+        writer.start()
+        self.server.subscribe(outbox)
+        try:
+            for line in self.rfile:
+                try:
+                    request = loads(line.decode('utf-8'))
+                except ValueError:
+                    outbox.put({'error': "Malformed request", 'type': 'ValueError'})
+                    continue
+                outbox.put(self.server.dispatch(request))
+        except OSError:
+            # Client went away mid-request.
+            pass
+        finally:
+            self.server.unsubscribe(outbox)
+            outbox.put(None)
+            writer.join()
+
+    def _write(self, outbox):
+        """Send every message put in the outbox until None is put in it."""
+        message = outbox.get()
+        while message is not None:
+            try:
+                self.request.sendall((dumps(message) + '\n').encode('utf-8'))
+            except OSError:
+                # Client is gone; keep emptying the outbox until the handler finishes.
+                pass
+            message = outbox.get()
+
+
+class RecipeServer(socketserver.ThreadingUnixStreamServer):
+    """Owns the shared shopping list and recipe cache, serving any number of clients over a Unix socket.
+
+    Every change to the list is sent to every client as journal records (see journal.encode_change).
+    """
+    daemon_threads = True
+
+    def __init__(self, address=SOCKET):
+        """Recover the shopping list and start listening.
+
+        :param address: the path of the socket (relative to the app)
+        :return: null
+        :raise OSError: if another server is already listening on the socket
+        """
+        path = socket_path(address)
+        if pth.exists(path):
+            # Remove a socket left behind by a server that didn't shut down, but never steal a live one.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.remove(path)
+            else:
+                raise OSError("A server is already listening on {}".format(path))
+            finally:
+                probe.close()
+        super().__init__(path, ClientHandler)
+
+        # Changes are made one at a time under _list_lock; records made by a change wait in _pending until sent.
+        self.shopping_list = Recipe()
+        self._journal = Journal(self.shopping_list, 'shopping_lists/data/.journal').replay().attach()
+        self._list_lock = Lock()
+        self._pending = []
+        self._subscribers = set()
+        self.shopping_list.add_listener(self.on_change)
+
+        # One cache for every client, so each recipe is only parsed once.
+        self._cache = RecipeCache()
+        self._cache_lock = Lock()
+
+        # Each request's operation and the method that handles it.
+        self._operations = {
+            'add': self.do_add,
+            'set': self.do_set,
+            'remove': self.do_remove,
+            'clear': self.do_clear,
+            'subtract': self.do_subtract,
+            'load': self.do_load,
+            'save_list': self.do_save_list,
+            'save_recipe': self.do_save_recipe,
+        }
+
+    def on_change(self, action, name, old, new):
+        """Collect the records of a change to the list, to be sent once the change is done."""
+        self._pending.extend(encode_change(action, name, old, new))
+
+    def _change(self, change):
+        """Make a change to the list, then send its records to every client.
+
+        :param change: a function making the change
+        :return: the result of change
+        """
+        with self._list_lock:
+            try:
+                return change()
+            finally:
+                if self._pending:
+                    message = {'records': self._pending}
+                    self._pending = []
+                    for outbox in self._subscribers:
+                        outbox.put(message)
+
+    def subscribe(self, outbox):
+        """Send the whole list to a new client, followed by every later change."""
+        with self._list_lock:
+            records = encode_change('replace', None, None, dict(self.shopping_list.items()))
+            outbox.put({'records': records})
+            self._subscribers.add(outbox)
+
+    def unsubscribe(self, outbox):
+        """Stop sending changes to a client."""
+        with self._list_lock:
+            self._subscribers.discard(outbox)
+
+    def dispatch(self, request):
+        """Carry out a client's request.
+
+        :param request: a dict of 'op' (the operation) and 'args' (a list of its arguments)
+        :return: a reply dict of 'reply' (the result), or 'error' and 'type' if it failed
+        """
+        operation = self._operations.get(request.get('op'))
+        if operation is None:
+            return {'error': "Unknown request", 'type': 'ValueError'}
+        try:
+            return {'reply': operation(*request.get('args', []))}
+        except Exception as error:
+            return {'error': str(error), 'type': type(error).__name__}
+
+    def do_add(self, name, quantity, qualifier):
+        """Add an ingredient to the list."""
+        self._change(lambda: self.shopping_list.add_ingredient(name, quantity, qualifier))
+
+    def do_set(self, name, quantity, qualifier):
+        """Set the quantity of an ingredient in the list."""
+        self._change(lambda: self.shopping_list.set_ingredient(name, quantity, qualifier))
+
+    def do_remove(self, name):
+        """Remove an ingredient from the list, returning it."""
+        return self._change(lambda: self.shopping_list.remove_ingredient(name))
+
+    def do_clear(self):
+        """Remove every ingredient from the list."""
+        self._change(self.shopping_list.clear)
+
+    def do_subtract(self, ingredients):
+        """Take a list of [name, quantity, qualifier] (a client's pantry, etc) off the list."""
+        other = Recipe().restore({name: (quantity, qualifier) for name, quantity, qualifier in ingredients})
+        self._change(lambda: self.shopping_list.subtract(other))
+
+    def do_load(self, directory, filename, times=1):
+        """Add a file to the list, through the shared cache.
+
+        :return: the number of ingredients in the file
+        """
+        if directory not in LOAD_DIRECTORIES:
+            raise PermissionError("Can't load from {}".format(directory))
+        path = _inside(directory, filename)
+        # The cache stays locked while the recipe is used, as a mapped recipe is closed if another load evicts it.
+        with self._cache_lock:
+            recipe = self._cache.load(path)
+            if times == 1:
+                self._change(lambda: recipe.add_to(self.shopping_list))
+            else:
+                self._change(lambda: self.shopping_list.add_weighted([(recipe, times)]))
+            return len(recipe)
+
+    def _snapshot(self):
+        """Copy the list, so it can be saved while clients keep changing it."""
+        with self._list_lock:
+            return self.shopping_list.copy()
+
+    def do_save_list(self, filename):
+        """Save the list to shopping_lists, both human-readable and as data."""
+        _inside('shopping_lists', filename)
+        save_list(self._snapshot(), filename)
+
+    def do_save_recipe(self, filename):
+        """Save the list as a recipe in saved_recipes."""
+        self._snapshot().save_to_file(_inside('saved_recipes', filename))
+
+    def server_close(self):
+        """Stop listening, remove the socket and close the journal."""
+        super().server_close()
+        if pth.exists(self.server_address):
+            os.remove(self.server_address)
+        self._journal.close()
+
+
+class RemoteRecipe(Recipe):
+    """Local mirror of a server's shopping list.
+
+    Changes are sent to the server, and only show up in the mirror once sync() applies the server's records,
+    so every client sees the same list in the same order.
+    """
+    __slots__ = ('_connection', '_updates', '_replies', '_call_lock', 'connected')
+
+    def __init__(self, address=SOCKET):
+        """Connect to a server and mirror its list.
+
+        :param address: the path of the server's socket (relative to the app)
+        :return: null
+        :raise OSError: if there is no server listening
+        """
+        super().__init__()
+        self._connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._connection.connect(socket_path(address))
+
+        # Records pushed by the server wait in _updates for sync(); replies to requests go to _replies.
+        self._updates = Queue()
+        self._replies = Queue()
+        self._call_lock = Lock()
+        self.connected = True
+        Thread(target=self._read, daemon=True).start()
+
+        # The server sends the whole list first.
+        self._apply(self._updates.get())
+
+    def _read(self):
+        """Sort messages from the server into updates and replies (run on a background thread)."""
+        try:
+            for line in self._connection.makefile('r', encoding='utf-8'):
+                message = loads(line)
+                if 'records' in message:
+                    self._updates.put(message['records'])
+                else:
+                    self._replies.put(message)
+        except (OSError, ValueError):
+            pass
+        self.connected = False
+        self._replies.put({'error': "Lost connection to server", 'type': 'ConnectionError'})
+
+    def _call(self, operation, *args):
+        """Send a request to the server and wait for its reply.
+
+        :return: the result of the request
+        :raise ConnectionError: if the connection to the server was lost
+        :raise: the error the request failed with
+        """
+        with self._call_lock:
+            if not self.connected:
+                raise ConnectionError("Not connected to server")
+            try:
+                self._connection.sendall((dumps({'op': operation, 'args': args}) + '\n').encode('utf-8'))
+            except OSError as error:
+                self.connected = False
+                raise ConnectionError("Lost connection to server") from error
+            reply = self._replies.get()
+        if 'error' in reply:
+            raise ERRORS.get(reply['type'], RuntimeError)(reply['error'])
+        return reply['reply']
+
+    def _apply(self, records):
+        """Apply records from the server to the mirror, telling its listeners as usual."""
+        for record in records:
+            if record[0] == 'set':
+                Recipe.set_ingredient(self, record[1], record[2], record[3])
+            elif record[0] == 'del':
+                if record[1] in self:
+                    Recipe.remove_ingredient(self, record[1])
+            elif record[0] == 'clear':
+                Recipe.restore(self, {})
+
+    def sync(self):
+        """Apply every change the server has sent since the last sync (call from the thread using the mirror).
+
+        :return: the number of updates applied
+        """
+        applied = 0
+        while True:
+            try:
+                records = self._updates.get_nowait()
+            except Empty:
+                return applied
+            self._apply(records)
+            applied += 1
+
+    def add_ingredient(self, name, quantity, qualifier):
+        """Add ingredient to the server's list (see Recipe.add_ingredient)."""
+        self._call('add', name, quantity, qualifier)
+        return self
+
+    def set_ingredient(self, name, quantity, qualifier):
+        """Set the quantity of an ingredient in the server's list (see Recipe.set_ingredient)."""
+        self._call('set', name, quantity, qualifier)
+        return self
+
+    def remove_ingredient(self, name):
+        """Remove ingredient from the server's list (see Recipe.remove_ingredient)."""
+        name, (quantity, qualifier) = self._call('remove', name)
+        return name, (quantity, qualifier)
+
+    def clear(self):
+        """Remove all ingredients from the server's list."""
+        self._call('clear')
+        return self
+
+    def subtract(self, other):
+        """Have the server take the ingredients of a recipe off its list (see Recipe.subtract)."""
+        self._call('subtract', [[name, quantity, qualifier] for name, (quantity, qualifier) in other.items()])
+        return self
+
+    def load(self, filename, times=1):
+        """Have the server add a saved recipe or list to its list, reading it through its shared cache.
+
+        :param filename: the file to load, starting with saved_recipes/ or shopping_lists/data/
+        :param times: how many times over to add it
+        :return: the number of ingredients in the file
+        """
+        directory, _, name = filename.rpartition('/')
+        return self._call('load', directory, name, times)
+
+    def save_list(self, filename):
+        """Have the server save its list (see MainScreen.save_list)."""
+        self._call('save_list', filename)
+        return self
+
+    def save_as_recipe(self, filename):
+        """Have the server save its list as a recipe."""
+        self._call('save_recipe', filename)
+        return self
+
+    def close(self):
+        """Disconnect from the server."""
+        self._connection.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Share one shopping list between many RecAppE terminals.")
+    parser.add_argument('--socket', default=SOCKET,
+                        help="path of the socket to listen on, relative to the app (default: {})".format(SOCKET))
+    args = parser.parse_args(args)
+
+    server = RecipeServer(args.socket)
+    print("Serving {} ingredients on {}".format(len(server.shopping_list), server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+__author__ = 'Kellan Childers'
+
+import os.path as pth
+import tempfile
+import unittest
+from binformat import MappedRecipe, save_binary
+from recipe import Recipe, is_binary
+
+
+class BinaryFormatTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.filename = pth.join(self._directory.name, 'recipe.rcpb')
+        self.recipe = Recipe()
+        self.recipe.add_ingredient('flour', 2.5, 'cups')
+        self.recipe.add_ingredient('Eggs', 3, '')
+        self.recipe.add_ingredient('crème fraîche', 1, 'cups')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def mapped(self):
+        save_binary(self.recipe, self.filename)
+        mapped = MappedRecipe(self.filename)
+        self.addCleanup(mapped.close)
+        return mapped
+
+    def test_round_trip(self):
+        mapped = self.mapped()
+        self.assertTrue(is_binary(self.filename))
+        self.assertEqual(len(mapped), 3)
+        self.assertEqual(dict(mapped.items()), dict(self.recipe.items()))
+        self.assertIsInstance(mapped.get_ingredient_quantity('Eggs')[0], int)
+
+    def test_lookup_any_spelling(self):
+        mapped = self.mapped()
+        self.assertEqual(mapped.get_ingredient_quantity('crème fraîche'), (1, 'cups'))
+        self.assertEqual(mapped.get_ingredient_quantity(' egg'), (3, ''))
+        self.assertNotIn('milk', mapped)
+        with self.assertRaises(ValueError):
+            mapped.get_ingredient_quantity('milk')
+
+    def test_rejects_other_files(self):
+        self.recipe.save_to_file(self.filename)
+        self.assertFalse(is_binary(self.filename))
+        with self.assertRaises(ValueError):
+            MappedRecipe(self.filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+__author__ = 'Kellan Childers'
+
+import json
+import os.path as pth
+import tempfile
+import unittest
+from catalog import Catalog
+
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.catalog = None
+
+    def tearDown(self):
+        if self.catalog is not None:
+            self.catalog.close()
+
+    def save(self, name, contents):
+        with open(pth.join(self.directory.name, name), 'w') as write_file:
+            json.dump(contents, write_file)
+
+    def open_catalog(self):
+        self.catalog = Catalog(self.directory.name)
+        return self.catalog
+
+    def test_refresh_indexes_recipes(self):
+        self.save('pancakes', {"flour": [2, "cups"], "eggs": [1, ""]})
+        catalog = self.open_catalog()
+        self.assertEqual(catalog.refresh(), 1)
+        self.assertEqual(catalog.refresh(), 0)
+        self.assertEqual(catalog.get_ingredients('pancakes'), {'flour': (2, 'cups'), 'eggs': (1, '')})
+
+    def test_refresh_skips_malformed_recipes(self):
+        self.save('pancakes', {"flour": [2, "cups"]})
+        self.save('short', {"eggs": [2]})
+        self.save('flat', {"x": "y"})
+        catalog = self.open_catalog()
+        self.assertEqual(catalog.refresh(), 3)
+        self.assertEqual(catalog.names(), ['pancakes'])
+        self.assertEqual(catalog.get_ingredients('pancakes'), {'flour': (2, 'cups')})
+
+    def test_refresh_follows_includes(self):
+        self.save('stock', {"bones": [1, ""]})
+        self.save('soup', {"stock": [2, "recipe"], "leeks": [3, ""]})
+        catalog = self.open_catalog()
+        catalog.refresh()
+        self.save('stock', {"bones": [2, ""], "carrots": [1, ""]})
+        self.assertEqual(catalog.refresh(), 2)
+        self.assertEqual(catalog.get_ingredients('soup')['bones'], (4, ''))
+
+
+if __name__ == "__main__":
+    unittest.main()
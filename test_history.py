@@ -0,0 +1,71 @@
+__author__ = 'Kellan Childers'
+
+import unittest
+from history import History
+from recipe import Recipe
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.recipe = Recipe()
+        self.history = History(self.recipe)
+
+    def contents(self):
+        return dict(self.recipe.items())
+
+    def test_undo_and_redo_single_changes(self):
+        self.recipe.add_ingredient('eggs', 2, '')
+        self.recipe.add_ingredient('eggs', 1, '')
+        self.recipe.remove_ingredient('eggs')
+        self.assertTrue(self.history.undo())
+        self.assertEqual(self.contents(), {'eggs': (3, '')})
+        self.assertTrue(self.history.undo())
+        self.assertEqual(self.contents(), {'eggs': (2, '')})
+        self.assertTrue(self.history.redo())
+        self.assertTrue(self.history.redo())
+        self.assertEqual(self.contents(), {})
+        self.assertFalse(self.history.redo())
+
+    def test_step_groups_changes(self):
+        self.history.begin()
+        self.recipe.add_ingredient('eggs', 2, '')
+        self.recipe.add_ingredient('flour', 1, 'cups')
+        self.history.end()
+        self.assertEqual(len(self.history), 1)
+        self.history.undo()
+        self.assertEqual(self.contents(), {})
+
+    def test_undo_and_redo_after_replace(self):
+        # Replacing the whole recipe, then changing it in place, must not change what the replace step recorded.
+        self.recipe.add_ingredient('eggs', 2, '')
+        self.recipe.add_ingredient('flour', 1, 'cups')
+        self.recipe.add_ingredient('milk', 1, 'cups')
+        self.recipe.restore({'eggs': (2, ''), 'flour': (1, 'cups')})
+        self.recipe.remove_ingredient('flour')
+        self.recipe.clear()
+
+        for _ in range(3):
+            self.assertTrue(self.history.undo())
+        self.assertEqual(self.contents(), {'eggs': (2, ''), 'flour': (1, 'cups'), 'milk': (1, 'cups')})
+        self.assertTrue(self.history.redo())
+        self.assertEqual(self.contents(), {'eggs': (2, ''), 'flour': (1, 'cups')})
+        self.assertTrue(self.history.redo())
+        self.assertEqual(self.contents(), {'eggs': (2, '')})
+        self.assertTrue(self.history.redo())
+        self.assertEqual(self.contents(), {})
+
+    def test_record_undoes_outside_changes(self):
+        state = []
+        self.history.record(lambda: state.append('undo'), lambda: state.append('redo'))
+        self.history.undo()
+        self.history.redo()
+        self.assertEqual(state, ['undo', 'redo'])
+
+    def test_forget(self):
+        self.recipe.add_ingredient('eggs', 2, '')
+        self.history.forget()
+        self.assertFalse(self.history.undo())
+
+
+if __name__ == "__main__":
+    unittest.main()
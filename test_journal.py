@@ -0,0 +1,61 @@
+__author__ = 'Kellan Childers'
+
+import os.path as pth
+import tempfile
+import unittest
+from journal import Journal
+from recipe import Recipe
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.filename = pth.join(self._directory.name, 'journal')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def recovered(self):
+        return dict(Journal(Recipe(), self.filename).recover().items())
+
+    def test_replays_changes(self):
+        recipe = Recipe()
+        journal = Journal(recipe, self.filename).attach()
+        recipe.add_ingredient('eggs', 2, '')
+        recipe.add_ingredient('flour', 1, 'cups')
+        recipe.remove_ingredient('eggs')
+        recipe.add_ingredient('milk', 1, 'cups')
+        journal.close()
+        self.assertEqual(self.recovered(), {'flour': (1, 'cups'), 'milk': (1, 'cups')})
+
+    def test_replays_clear(self):
+        recipe = Recipe()
+        journal = Journal(recipe, self.filename).attach()
+        recipe.add_ingredient('eggs', 2, '')
+        recipe.clear()
+        recipe.add_ingredient('milk', 1, 'cups')
+        journal.close()
+        self.assertEqual(self.recovered(), {'milk': (1, 'cups')})
+
+    def test_compaction_keeps_changes(self):
+        recipe = Recipe()
+        journal = Journal(recipe, self.filename, max_records=3).attach()
+        for number in range(10):
+            recipe.add_ingredient('item {}'.format(number), number, '')
+        journal.close()
+        self.assertEqual(self.recovered(), dict(recipe.items()))
+
+    def test_checkpoint_empties_log(self):
+        recipe = Recipe()
+        journal = Journal(recipe, self.filename).attach()
+        recipe.add_ingredient('eggs', 2, '')
+        journal.checkpoint()
+        recipe.add_ingredient('eggs', 1, '')
+        journal.close()
+        with open(self.filename) as read_file:
+            self.assertEqual(len(read_file.readlines()), 1)
+        self.assertEqual(self.recovered(), {'eggs': (3, '')})
+
+
+if __name__ == "__main__":
+    unittest.main()
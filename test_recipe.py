@@ -0,0 +1,82 @@
+__author__ = 'Kellan Childers'
+
+import unittest
+from compact_recipe import CompactRecipe
+from recipe import Recipe
+
+
+class RecipeTest(unittest.TestCase):
+    recipe_class = Recipe
+
+    def setUp(self):
+        self.recipe = self.recipe_class()
+        self.changes = []
+        self.recipe.add_listener(lambda *change: self.changes.append(change))
+
+    def test_restore_strips_names(self):
+        self.recipe.restore({' b ': (1, ''), 'Eggs ': (2, '')})
+        self.assertEqual(dict(self.recipe.items()), {'b': (1, ''), 'Eggs': (2, '')})
+        self.assertEqual(self.recipe.get_ingredient_quantity(' eggs'), (2, ''))
+        self.recipe.add_ingredient('b', 1, '')
+        self.assertEqual(dict(self.recipe.items()), {'b': (2, ''), 'Eggs': (2, '')})
+
+    def test_restore_notifies_stored_names(self):
+        self.recipe.restore({' b ': (1, '')})
+        action, name, old, new = self.changes[-1]
+        self.assertEqual(action, 'replace')
+        self.assertEqual(new, {'b': (1, '')})
+
+    def test_restore_merges_spellings(self):
+        self.recipe.restore({'Onion': (1, ''), ' onions': (2, '')})
+        self.assertEqual(dict(self.recipe.items()), {'Onion': (3, '')})
+
+    def fill(self, *names):
+        for name in names:
+            self.recipe.add_ingredient(name, 3, '')
+        return self.recipe
+
+    def test_subtract_any_spelling(self):
+        # Both when the list is the smaller recipe and when it is the larger one.
+        self.fill('eggs')
+        self.recipe.subtract(Recipe().add_ingredient('Eggs ', 1, '').add_ingredient('milk', 1, ''))
+        self.assertEqual(self.recipe.get_ingredient_quantity('eggs'), (2, ''))
+        self.fill('flour', 'milk')
+        self.recipe.subtract(Recipe().add_ingredient(' EGGS', 2, ''))
+        self.assertNotIn('eggs', self.recipe)
+
+    def test_subtract_totals_spellings(self):
+        self.fill('eggs', 'flour', 'milk')
+        self.recipe.subtract({'eggs': (1, ''), 'Eggs ': (1, '')})
+        self.assertEqual(self.recipe.get_ingredient_quantity('eggs'), (1, ''))
+
+    def test_subtract_converts_units(self):
+        self.recipe.add_ingredient('milk', 2, 'cups')
+        self.recipe.subtract(Recipe().add_ingredient('milk', 8, 'fl oz'))
+        self.assertAlmostEqual(self.recipe.get_ingredient_quantity('milk')[0], 1)
+
+    def test_subtract_leaves_unconvertible(self):
+        self.recipe.add_ingredient('eggs', 2, '')
+        self.recipe.subtract(Recipe().add_ingredient('eggs', 1, 'cups'))
+        self.assertEqual(self.recipe.get_ingredient_quantity('eggs'), (2, ''))
+
+    def test_scale(self):
+        self.recipe.add_ingredient('flour', 2, 'cups').add_ingredient('eggs', 3, '')
+        self.recipe.scale(1.5)
+        self.assertEqual(dict(self.recipe.items()), {'flour': (3, 'cups'), 'eggs': (4.5, '')})
+        self.assertEqual(self.recipe.get_ingredient_quantity('Egg'), (4.5, ''))
+
+    def test_add_weighted(self):
+        pancakes = Recipe().add_ingredient('flour', 2, 'cups').add_ingredient('eggs', 1, '')
+        bread = Recipe().add_ingredient('flour', 3, 'cups')
+        self.recipe.add_ingredient('Eggs', 1, '')
+        self.recipe.add_weighted([(pancakes, 2), (bread, 0.5)])
+        self.assertEqual(dict(self.recipe.items()), {'Eggs': (3, ''), 'flour': (5.5, 'cups')})
+        self.assertEqual(self.recipe.merged, 1)
+
+
+class CompactRecipeTest(RecipeTest):
+    recipe_class = CompactRecipe
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+__author__ = 'Kellan Childers'
+
+import unittest
+from recipe import Recipe
+from search import CompletionIndex
+
+
+class CompletionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = CompletionIndex(['green onion', 'Onion', 'onion powder', 'lemon', 'flour'])
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.index.complete('on', limit=2), ['Onion', 'onion powder'])
+
+    def test_fuzzy_matches(self):
+        self.assertEqual(self.index.complete('oni')[:3], ['Onion', 'onion powder', 'green onion'])
+        self.assertIn('lemon', self.index.complete('lemn'))
+        self.assertEqual(self.index.complete(''), [])
+
+    def test_add_and_remove(self):
+        self.index.add('oregano').remove('Onion')
+        self.assertEqual(self.index.complete('o', limit=2), ['oregano', 'onion powder'])
+        self.assertNotIn('Onion', self.index)
+
+    def test_follows_recipe(self):
+        recipe = Recipe()
+        index = CompletionIndex()
+        recipe.add_listener(index.on_change)
+        recipe.add_ingredient('eggs', 2, '')
+        recipe.add_ingredient('milk', 1, 'cups')
+        recipe.remove_ingredient('eggs')
+        self.assertEqual(index.complete('e'), [])
+        recipe.restore({'butter': (1, 'cups')})
+        self.assertEqual(index.complete('bu'), ['butter'])
+        self.assertNotIn('milk', index)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+__author__ = 'Kellan Childers'
+
+import os
+import os.path as pth
+import stat
+import tempfile
+import unittest
+import util
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.filename = pth.join(self._directory.name, 'recipe')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def mode(self):
+        return stat.S_IMODE(os.stat(self.filename).st_mode)
+
+    def test_new_file_follows_umask(self):
+        with util.atomic_write(self.filename) as write_file:
+            write_file.write('{}')
+        self.assertEqual(self.mode(), 0o666 & ~util._UMASK)
+
+    def test_replaced_file_keeps_mode(self):
+        with open(self.filename, "w") as write_file:
+            write_file.write('{}')
+        os.chmod(self.filename, 0o640)
+        with util.atomic_write(self.filename) as write_file:
+            write_file.write('{"eggs": [2, ""]}')
+        self.assertEqual(self.mode(), 0o640)
+        with open(self.filename) as read_file:
+            self.assertEqual(read_file.read(), '{"eggs": [2, ""]}')
+
+    def test_failed_write_leaves_file(self):
+        with open(self.filename, "w") as write_file:
+            write_file.write('{}')
+        with self.assertRaises(RuntimeError):
+            with util.atomic_write(self.filename) as write_file:
+                write_file.write('partial')
+                raise RuntimeError
+        with open(self.filename) as read_file:
+            self.assertEqual(read_file.read(), '{}')
+        self.assertEqual(os.listdir(self._directory.name), ['recipe'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+__author__ = 'Kellan Childers'
+
+from fractions import Fraction
+from math import isfinite
+
+MASS, VOLUME, COUNT = 'mass', 'volume', 'count'
+
+# Every spelling of a unit, mapped to its dimension and its size in the dimension's base unit
+# (grams, milliliters or single items).
+_UNITS = {
+    MASS: [
+        (1.0, 'g', 'gram', 'grams', 'gr'),
+        (1000.0, 'kg', 'kilogram', 'kilograms', 'kilo', 'kilos'),
+        (28.349523125, 'oz', 'ounce', 'ounces'),
+        (453.59237, 'lb', 'lbs', 'pound', 'pounds'),
+    ],
+    VOLUME: [
+        (1.0, 'ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+        (1000.0, 'l', 'liter', 'liters', 'litre', 'litres'),
+        (4.92892159375, 'tsp', 'teaspoon', 'teaspoons'),
+        (14.78676478125, 'tbsp', 'tablespoon', 'tablespoons', 'tbs', 'tbl'),
+        (29.5735295625, 'fl oz', 'fluid ounce', 'fluid ounces'),
+        (236.5882365, 'cup', 'cups', 'c'),
+        (473.176473, 'pint', 'pints', 'pt'),
+        (946.352946, 'quart', 'quarts', 'qt'),
+        (3785.411784, 'gallon', 'gallons', 'gal'),
+    ],
+    COUNT: [
+        (1.0, '', 'whole', 'each', 'piece', 'pieces'),
+        (12.0, 'dozen', 'dozens'),
+    ],
+}
+
+# Units a quantity may be shown in, smallest first, as (singular, plural) labels.
+_LADDERS = [
+    [('tsp', 'tsp'), ('tbsp', 'tbsp'), ('cup', 'cups')],
+    [('ml', 'ml'), ('l', 'l')],
+    [('oz', 'oz'), ('lb', 'lb')],
+    [('g', 'g'), ('kg', 'kg')],
+]
+
+# Grams per milliliter, used to convert between volume and mass of an ingredient.
+DEFAULT_DENSITIES = {
+    'water': 1.0,
+    'milk': 1.03,
+    'cream': 1.01,
+    'oil': 0.92,
+    'butter': 0.96,
+    'honey': 1.42,
+    'flour': 0.53,
+    'sugar': 0.85,
+    'brown sugar': 0.93,
+    'powdered sugar': 0.56,
+    'salt': 1.2,
+    'rice': 0.85,
+    'oats': 0.41,
+    'cocoa': 0.42,
+}
+
+
+def format_quantity(quantity):
+    """Show a quantity without float noise (3.0 shows as 3, 0.333333 as 0.33)."""
+    if isinstance(quantity, float):
+        quantity = round(quantity, 2)
+        return str(int(quantity)) if quantity.is_integer() else '{:g}'.format(quantity)
+    return str(quantity)
+
+
+# Fraction characters and the fractions they are written as.
+_FRACTION_CHARACTERS = {
+    '\u00bd': '1/2', '\u2153': '1/3', '\u2154': '2/3', '\u00bc': '1/4', '\u00be': '3/4',
+    '\u2155': '1/5', '\u2156': '2/5', '\u2157': '3/5', '\u2158': '4/5', '\u2159': '1/6', '\u215a': '5/6',
+    '\u215b': '1/8', '\u215c': '3/8', '\u215d': '5/8', '\u215e': '7/8', '\u2044': '/',
+}
+_FRACTION_TABLE = str.maketrans({character: ' ' + fraction if fraction != '/' else fraction
+                                 for character, fraction in _FRACTION_CHARACTERS.items()})
+
+
+# Quantities already read, by the text they were written as, and how many are remembered.
+_parsed = {}
+_MAX_PARSED = 1 << 12
+
+
+def _parse_text(text):
+    """Read a quantity written as text (see parse_quantity)."""
+    try:
+        # Most quantities are plain numbers, which float() reads far faster than Fraction.
+        value = float(text)
+    except ValueError:
+        parts = text.translate(_FRACTION_TABLE).split()
+        try:
+            values = [Fraction(part) for part in parts]
+        except (ValueError, ZeroDivisionError):
+            raise ValueError("Not a quantity: {!r}".format(text))
+        # A mixed number is a whole number followed by a fraction smaller than one.
+        if not 1 <= len(values) <= 2 or len(values) == 2 and (
+                values[0].denominator != 1 or '/' not in parts[1] or not 0 < values[1] < 1):
+            raise ValueError("Not a quantity: {!r}".format(text))
+        value = float(sum(values))
+    return _checked(value, text)
+
+
+def _checked(value, text):
+    """Check that a quantity is positive and finite, and make it an int if it is whole."""
+    if not (value > 0 and (isinstance(value, int) or isfinite(value))):
+        raise ValueError("Quantity must be positive and finite: {!r}".format(text))
+    return value if isinstance(value, int) or not value.is_integer() else int(value)
+
+
+def parse_quantity(text):
+    """Read a quantity written as a whole number, decimal, fraction or mixed number.
+
+    "2", "0.5", "3/4", "1 1/2", "1½" and "½" are all read, as are numbers that are already ints or floats. Texts
+    read before are remembered, as dumps and lists write the same few quantities over and over.
+    :param text: the quantity as written
+    :return: an int if the quantity is whole, otherwise a float
+    :raise ValueError: if text isn't a positive, finite quantity
+    """
+    if isinstance(text, str):
+        value = _parsed.get(text)
+        if value is None:
+            value = _parse_text(text)
+            if len(_parsed) >= _MAX_PARSED:
+                _parsed.clear()
+            _parsed[text] = value
+        return value
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return _checked(text, text)
+    raise ValueError("Not a quantity: {!r}".format(text))
+
+
+class UnitRegistry:
+    """Converts ingredient quantities between units of mass, volume and count."""
+    def __init__(self, densities=None):
+        """Create a registry of every known unit.
+
+        :param densities: a dict of ingredient name to grams per milliliter (defaults to DEFAULT_DENSITIES)
+        :return: null
+        """
+        self._units = {}
+        for dimension, units in _UNITS.items():
+            for size, *names in units:
+                for name in names:
+                    self._units[name] = (dimension, size)
+
+        # Each ladder step as (dimension, size, singular, plural), found from any spelling of its units.
+        self._ladders = {}
+        for ladder in _LADDERS:
+            steps = [self._units[singular] + (singular, plural) for singular, plural in ladder]
+            sizes = {step[:2] for step in steps}
+            for name, unit in self._units.items():
+                if unit in sizes:
+                    self._ladders[name] = steps
+
+        self._densities = dict(DEFAULT_DENSITIES if densities is None else densities)
+
+    def set_density(self, ingredient, grams_per_milliliter):
+        """Override the density of an ingredient.
+
+        :param ingredient: the name of the ingredient
+        :param grams_per_milliliter: the weight of a milliliter of the ingredient
+        :return: a reference to the registry
+        """
+        self._densities[ingredient.strip().lower()] = grams_per_milliliter
+        return self
+
+    def density(self, ingredient):
+        """Get the density of an ingredient, falling back on its last word ('bread flour' uses 'flour').
+
+        :param ingredient: the name of the ingredient
+        :return: grams per milliliter, or None if the density isn't known
+        """
+        ingredient = ingredient.strip().lower()
+        density = self._densities.get(ingredient)
+        if density is None and ' ' in ingredient:
+            density = self._densities.get(ingredient.rsplit(' ', 1)[1])
+        return density
+
+    def unit(self, qualifier):
+        """Look up a qualifier.
+
+        :param qualifier: the qualifier of a quantity (cups, grams, etc)
+        :return: a tuple of the dimension and size in base units, or None if it isn't a unit
+        """
+        return self._units.get(qualifier.strip().lower())
+
+    def factor(self, from_qualifier, to_qualifier, ingredient=''):
+        """Get the number to multiply a quantity by to change its qualifier.
+
+        :param from_qualifier: the qualifier the quantity is in
+        :param to_qualifier: the qualifier wanted
+        :param ingredient: the name of the ingredient (needed to convert between mass and volume)
+        :return: the conversion factor, or None if the qualifiers can't be converted
+        """
+        from_unit = self._units.get(from_qualifier.strip().lower())
+        to_unit = self._units.get(to_qualifier.strip().lower())
+        if from_unit is None or to_unit is None:
+            # Qualifiers that aren't units (chopped, cloves, etc) only match themselves.
+            return 1 if from_qualifier.strip().lower() == to_qualifier.strip().lower() else None
+        if from_unit[0] == to_unit[0]:
+            return from_unit[1] / to_unit[1]
+
+        density = self.density(ingredient) if {from_unit[0], to_unit[0]} == {MASS, VOLUME} else None
+        if density is None:
+            return None
+        if from_unit[0] == VOLUME:
+            return from_unit[1] * density / to_unit[1]
+        return from_unit[1] / density / to_unit[1]
+
+    def readable(self, quantity, qualifier):
+        """Change a quantity to the unit it reads best in (48 tsp becomes 1 cup).
+
+        The quantity keeps its unit unless it is at least one of a larger unit, or under a quarter of its own.
+        :param quantity: the quantity to show
+        :param qualifier: the qualifier of the quantity
+        :return: a tuple of the quantity and qualifier to show
+        """
+        ladder = self._ladders.get(qualifier.strip().lower())
+        if ladder is None:
+            # Qualifiers off the ladder (pints, dozens, chopped, etc) are shown as entered.
+            return quantity, qualifier
+
+        unit = self._units[qualifier.strip().lower()]
+        base = quantity * unit[1]
+        larger = [step for step in ladder if step[1] > unit[1] and base >= step[1]]
+        if larger:
+            step = larger[-1]
+        elif quantity < 0.25:
+            smaller = [step for step in ladder if step[1] < unit[1] and base >= step[1]]
+            if not smaller:
+                return quantity, qualifier
+            step = smaller[-1]
+        else:
+            return quantity, qualifier
+
+        new_quantity = base / step[1]
+        return new_quantity, step[2] if round(new_quantity, 2) == 1 else step[3]
+
+
+# Registry shared by every recipe.
+registry = UnitRegistry()
@@ -1,8 +1,15 @@
 __author__ = 'Kellan Childers'
 
 import curses
+import os
+import os.path as pth
+from contextlib import contextmanager
 from math import floor
 
+# The process's umask, read once at import (reading it means setting it, which isn't safe once threads are running).
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 
 def center_start(console_height, console_width, window_height, window_width):
     """Find point to start window on center.
@@ -34,15 +41,42 @@ def size_lim(console_height, console_width, bound_height, bound_width):
 
 def color_box(window, start_y, start_x, stop_y, stop_x, color):
     """Create a border around a window in a certain color."""
+    # Each side is drawn as one line instead of cell by cell.
+    border = ord(' ') | curses.color_pair(color)
     try:
-        for i in range(start_y, stop_y):
-            window.addstr(i, start_x, ' ', curses.color_pair(color))
-            window.addstr(i, stop_x, ' ', curses.color_pair(color))
-        for i in range(start_x, stop_x):
-            window.addstr(start_y, i, ' ', curses.color_pair(color))
-            window.addstr(stop_y, i, ' ', curses.color_pair(color))
-        # for loops fail to add last element.
-        window.addstr(stop_y, stop_x, ' ', curses.color_pair(color))
+        window.hline(start_y, start_x, border, stop_x-start_x+1)
+        window.hline(stop_y, start_x, border, stop_x-start_x+1)
+        window.vline(start_y, start_x, border, stop_y-start_y+1)
+        window.vline(start_y, stop_x, border, stop_y-start_y+1)
     except curses.error:
-        # curses.error is raised at end of line and can safely be ignored.
+        # curses.error is raised if the box doesn't fit in the window and can safely be ignored.
         pass
+
+
+@contextmanager
+def atomic_write(filename, mode="w"):
+    """Open a file for writing so it is only replaced once writing fully succeeds.
+
+    Data is written to a temporary file in the same directory, which is renamed over filename on success. The file
+    keeps the permissions of the file it replaces, or gets the umask's permissions if it is new, as open() would.
+    :param filename: the path of the file to write
+    :param mode: the mode to open the temporary file with ("w" or "wb")
+    :return: a context manager giving the open temporary file
+    """
+    # Imported here, so starting the app doesn't wait for it.
+    from tempfile import NamedTemporaryFile
+    write_file = NamedTemporaryFile(mode, dir=pth.dirname(pth.abspath(filename)),
+                                    prefix='.' + pth.basename(filename) + '.', suffix='.tmp', delete=False)
+    try:
+        with write_file:
+            yield write_file
+        # Temporary files are created owner-only, so give it the permissions the file should have.
+        try:
+            permissions = os.stat(filename).st_mode & 0o7777
+        except FileNotFoundError:
+            permissions = 0o666 & ~_UMASK
+        os.chmod(write_file.name, permissions)
+        os.replace(write_file.name, filename)
+    except BaseException:
+        os.remove(write_file.name)
+        raise